@@ -2,19 +2,42 @@ import io
 import logging
 from typing import Dict, List, Optional, Union
 
-import chess
 from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
-from app.db.supabase import get_current_user, get_supabase_client
+from app.core.config import settings
+from app.db.supabase import execute_query, get_current_user, get_supabase_client
 from app.models.analysis import GameAnalysisResult, MoveAnalysis, PositionAnalysis
+from app.services.board_cache import board_from_fen
 from app.services.analysis import analysis_service
+from app.services.ttl_cache import TTLCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Game analyses recently computed or read back from the database. Keys start
+# with the game ID: (game_id,) for stored annotations and (game_id, depth, pgn)
+# for on-demand analyses
+_analysis_cache = TTLCache(settings.ANALYSIS_CACHE_TTL)
+
+
+def _annotation_ply(annotation: Dict) -> int:
+    """
+    Get the ply of a stored annotation, to sort annotations in move order.
+
+    White and black moves share their move number, and white moves first.
+
+    Args:
+        annotation: Row of enhanced_move_annotations
+
+    Returns:
+        int: Ply of the annotated move
+    """
+    return 2 * annotation.get("move_number", 0) + (annotation.get("color") == "black")
+
 
 class PositionAnalysisRequest(BaseModel):
     """Request model for position analysis."""
@@ -42,9 +65,7 @@ async def analyze_position(request: PositionAnalysisRequest):
     try:
         # Validate FEN format
         try:
-            import chess
-
-            chess.Board(request.fen)  # Will raise ValueError if FEN is invalid
+            board_from_fen(request.fen)  # Will raise ValueError if FEN is invalid
         except ValueError as fen_error:
             logger.warning(f"Invalid FEN format: {request.fen} - {str(fen_error)}")
             raise HTTPException(
@@ -62,7 +83,10 @@ async def analyze_position(request: PositionAnalysisRequest):
         result = await analysis_service.analyze_position(request.fen, request.depth)
 
         logger.info(f"Position analysis complete: {request.fen}")
-        return result
+
+        # The analysis was just built here, so serialize it directly instead of
+        # validating it again against the response_model
+        return ORJSONResponse(result.dict())
 
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -105,7 +129,9 @@ async def analyze_game_by_id(
 
     try:
         # Get the game from the database
-        game_response = supabase.table("games").select("*").eq("id", game_id).execute()
+        game_response = await execute_query(
+            supabase.table("games").select("*").eq("id", game_id)
+        )
 
         if len(game_response.data) == 0:
             raise HTTPException(
@@ -128,10 +154,15 @@ async def analyze_game_by_id(
                 detail="Game does not contain valid PGN data required for analysis",
             )
 
-        # Analyze the game
-        result = await analysis_service.analyze_game(pgn, depth, game_id)
+        # Analyze the game, unless it was analyzed at this depth recently
+        cache_key = (game_id, depth, pgn)
+        result = _analysis_cache.get(cache_key)
+        if result is None:
+            result = await analysis_service.analyze_game(pgn, depth, game_id)
+            _analysis_cache.set(cache_key, result)
 
-        return result
+        # Serialize the fresh analysis directly, skipping response validation
+        return ORJSONResponse(result.dict())
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -170,7 +201,9 @@ async def enhanced_annotate_game(
 
     try:
         # Get the game from the database
-        game_response = supabase.table("games").select("*").eq("id", game_id).execute()
+        game_response = await execute_query(
+            supabase.table("games").select("*").eq("id", game_id)
+        )
 
         if len(game_response.data) == 0:
             raise HTTPException(
@@ -189,12 +222,11 @@ async def enhanced_annotate_game(
         # If the game is already analyzed and we just want status, return existing data
         if game.get("enhanced_analyzed", False) and not wait_for_analysis:
             # Get the enhanced annotations
-            annotations_response = (
+            annotations_response = await execute_query(
                 supabase.table("enhanced_move_annotations")
                 .select("*")
                 .eq("game_id", game_id)
-                .order("id")
-                .execute()
+                .order("move_number")
             )
 
             if len(annotations_response.data) > 0:
@@ -218,42 +250,50 @@ async def enhanced_annotate_game(
 
         # For non-waiting requests, mark as processing and queue for background processing
         if not wait_for_analysis:
-            # Check if processing is already happening (for race condition protection)
-            # Check again since race conditions can happen between the initial check and here
-            game_check = supabase.table("games").select("processing").eq("id", game_id).execute()
-            if game_check.data and game_check.data[0].get("processing", False):
-                logger.info(f"Game {game_id} already being processed, returning processing status")
+            # Import the queue helpers here to avoid circular imports
+            from app.api.routes.game import (
+                notify_processing_workers,
+                queued_at_now,
+                queued_game_count,
+            )
+
+            # Apply backpressure when the processing queue is full
+            if await queued_game_count(supabase) >= settings.ANNOTATION_QUEUE_SIZE:
+                logger.warning(f"Processing queue full, could not queue game {game_id}")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Game processing queue is full, please retry later",
+                )
+
+            # Mark game as processing and queue it, as long as nobody claimed
+            # it since it was read (every claim bumps lock_version)
+            lock_version = game.get("lock_version", 0)
+            update_result = await execute_query(
+                supabase.table("games")
+                .update(
+                    {
+                        "processing": True,
+                        "annotation_queued_at": queued_at_now(),
+                        "lock_version": lock_version + 1,
+                    }
+                )
+                .eq("id", game_id)
+                .eq("lock_version", lock_version)
+            )
+
+            # If no rows were updated, someone else claimed the game first
+            if not update_result.data or len(update_result.data) == 0:
+                logger.warning(
+                    f"Game {game_id} was claimed by another request (lock version {lock_version} is stale)"
+                )
                 return GameAnalysisResult(
                     game_id=game_id,
                     status="processing",
-                    message="Game is currently being analyzed",
+                    message="Game is currently being analyzed by another request",
                 )
-            
-            try:
-                # Mark game as processing with atomicity check
-                update_result = supabase.table("games").update({"processing": True}).eq(
-                    "id", game_id
-                ).eq("processing", False).execute()
-                
-                # If no rows were updated, someone else started processing
-                if not update_result.data or len(update_result.data) == 0:
-                    logger.warning(f"Game {game_id} was being processed by another request (race condition)")
-                    return GameAnalysisResult(
-                        game_id=game_id,
-                        status="processing",
-                        message="Game is currently being analyzed by another request",
-                    )
-                
-                logger.info(f"Successfully marked game {game_id} as processing")
-            except Exception as e:
-                logger.error(f"Error marking game {game_id} as processing: {e}")
-                # Continue with queuing even if marking fails - worst case is double processing
 
-            # Import the process_game_async function here to avoid circular imports
-            from app.api.routes.game import process_game_async
-
-            # Queue game for processing in background
-            await process_game_async(game_id, user_id)
+            # Wake the workers of this instance instead of waiting for their next poll
+            notify_processing_workers()
             logger.info(f"Successfully queued game {game_id} for background processing")
 
             # Return immediate response with status
@@ -265,28 +305,34 @@ async def enhanced_annotate_game(
 
         # Check if the game is already enhanced analyzed
         if game.get("enhanced_analyzed", False):
+            # Serve annotations read back recently without querying them again
+            cached = _analysis_cache.get((game_id,))
+            if cached is not None:
+                return cached
+
             # If already annotated, just return the existing annotations
             try:
                 # Retrieve the enhanced annotations
-                annotations_response = (
+                annotations_response = await execute_query(
                     supabase.table("enhanced_move_annotations")
                     .select("*")
                     .eq("game_id", game_id)
-                    .order("id")
-                    .execute()
+                    .order("move_number")
                 )
+                # The square control before each move is taken from the
+                # previous annotation, so they must be in move order
+                annotation_rows = sorted(annotations_response.data, key=_annotation_ply)
 
-                if len(annotations_response.data) > 0:
+                if len(annotation_rows) > 0:
                     # Convert to MoveAnalysis objects
                     annotations = []
 
-                    for annotation_data in annotations_response.data:
+                    for annotation_data in annotation_rows:
                         # Get tactical motifs
-                        tactical_motifs_response = (
+                        tactical_motifs_response = await execute_query(
                             supabase.table("tactical_motifs")
                             .select("*")
                             .eq("annotation_id", annotation_data["id"])
-                            .execute()
                         )
 
                         # Build the move analysis
@@ -300,16 +346,12 @@ async def enhanced_annotate_game(
                             fen_after=annotation_data["fen_after"],
                             evaluation_before=annotation_data["evaluation_before"],
                             evaluation_after=annotation_data["evaluation_after"],
-                            evaluation_change=annotation_data["evaluation_change"],
                             classification=annotation_data["classification"],
                             is_best_move=annotation_data["is_best_move"],
                             is_book_move=annotation_data["is_book_move"],
                             # Convert tactical motifs
                             tactical_motifs=tactical_motifs_response.data,
                             # Parse square control
-                            square_control_before=annotation_data[
-                                "square_control_before"
-                            ],
                             square_control_after=annotation_data[
                                 "square_control_after"
                             ],
@@ -319,11 +361,10 @@ async def enhanced_annotate_game(
                         annotations.append(move_analysis)
 
                     # Get player weakness report
-                    weakness_response = (
+                    weakness_response = await execute_query(
                         supabase.table("player_weakness_reports")
                         .select("*")
                         .eq("game_id", game_id)
-                        .execute()
                     )
 
                     player_weaknesses = {
@@ -344,13 +385,18 @@ async def enhanced_annotate_game(
                         }
                         critical_positions = weakness_data.get("critical_positions", [])
 
-                    return GameAnalysisResult(
+                    stored_result = GameAnalysisResult(
                         game_id=game_id,
                         total_moves=len(annotations),
                         annotations=annotations,
+                        initial_square_control=annotation_rows[0][
+                            "square_control_before"
+                        ],
                         player_weaknesses=player_weaknesses,
                         critical_positions=critical_positions,
                     )
+                    _analysis_cache.set((game_id,), stored_result)
+                    return stored_result
             except Exception as e:
                 logger.warning(
                     f"Failed to retrieve existing enhanced annotations for game {game_id}: {e}"
@@ -368,56 +414,33 @@ async def enhanced_annotate_game(
         # Perform the enhanced analysis
         analysis_result = await analysis_service.analyze_game(pgn=pgn, game_id=game_id)
 
-        # Store enhanced annotations in the database using a more robust transaction approach
+        # Store enhanced annotations, motifs and the weakness report in one
+        # transaction, so a failed run never leaves partial results behind
         successful_transaction = False
         db_error = None
-        stored_annotation_ids = []
 
         try:
-            # Phase 1: Clear any existing data for this game to avoid duplicates
-            # We track each step for better error recovery
-            logger.info(f"Cleaning up previous analysis data for game {game_id}")
-            try:
-                supabase.table("enhanced_move_annotations").delete().eq(
-                    "game_id", game_id
-                ).execute()
-                supabase.table("player_weakness_reports").delete().eq(
-                    "game_id", game_id
-                ).execute()
-                logger.info(
-                    f"Successfully cleaned up previous analysis data for game {game_id}"
-                )
-            except Exception as cleanup_error:
-                logger.error(
-                    f"Failed to clean up previous analysis data: {cleanup_error}"
-                )
-                raise Exception(f"Database cleanup error: {cleanup_error}")
-
-            # Phase 2: Store each move annotation
-            logger.info(f"Storing {len(analysis_result.annotations)} move annotations")
-            for annotation in analysis_result.annotations:
-                try:
-                    # Generate move improvement suggestions if not provided
-                    if (
-                        not annotation.move_improvement
-                        and annotation.classification in ["mistake", "blunder"]
-                    ):
-                        if annotation.is_best_move:
-                            move_improvement = (
-                                "This was the best move despite the evaluation change."
-                            )
-                        else:
-                            move_improvement = "Consider a different move."
+            annotation_rows = []
+            for index, annotation in enumerate(analysis_result.annotations):
+                # Generate move improvement suggestions if not provided
+                if not annotation.move_improvement and annotation.classification in [
+                    "mistake",
+                    "blunder",
+                ]:
+                    if annotation.is_best_move:
+                        move_improvement = (
+                            "This was the best move despite the evaluation change."
+                        )
                     else:
-                        move_improvement = annotation.move_improvement or ""
+                        move_improvement = "Consider a different move."
+                else:
+                    move_improvement = annotation.move_improvement or ""
 
-                    # Determine the color of the player making this move
-                    board = chess.Board(annotation.fen_before)
-                    color = "white" if board.turn == chess.WHITE else "black"
+                # The side to move is the second field of the FEN
+                color = "white" if annotation.fen_before.split()[1] == "w" else "black"
 
-                    # Convert annotation to dictionary for storage
-                    annotation_dict = {
-                        "game_id": game_id,
+                annotation_rows.append(
+                    {
                         "move_uci": annotation.move_uci,
                         "move_san": annotation.move_san,
                         "move_number": annotation.move_number,
@@ -433,118 +456,41 @@ async def enhanced_annotate_game(
                         "best_move": annotation.best_move,
                         "move_improvement": move_improvement,
                         # Convert square control to JSON
-                        "square_control_before": {
-                            "white_control": annotation.square_control_before.white_control,
-                            "black_control": annotation.square_control_before.black_control,
-                            "white_control_material": annotation.square_control_before.white_control_material,
-                            "black_control_material": annotation.square_control_before.black_control_material,
-                            "white_legal_moves": annotation.square_control_before.white_legal_moves,
-                            "black_legal_moves": annotation.square_control_before.black_legal_moves,
-                        },
-                        "square_control_after": {
-                            "white_control": annotation.square_control_after.white_control,
-                            "black_control": annotation.square_control_after.black_control,
-                            "white_control_material": annotation.square_control_after.white_control_material,
-                            "black_control_material": annotation.square_control_after.black_control_material,
-                            "white_legal_moves": annotation.square_control_after.white_legal_moves,
-                            "black_legal_moves": annotation.square_control_after.black_legal_moves,
-                        },
+                        "square_control_before": analysis_result.square_control_before(
+                            index
+                        ).dict(),
+                        "square_control_after": annotation.square_control_after.dict(),
+                        "tactical_motifs": [
+                            motif.dict() for motif in annotation.tactical_motifs
+                        ],
                     }
+                )
 
-                    # Insert annotation with better error handling
-                    annotation_response = (
-                        supabase.table("enhanced_move_annotations")
-                        .insert(annotation_dict)
-                        .execute()
-                    )
-
-                    # Get inserted annotation ID and store tactical motifs
-                    if len(annotation_response.data) > 0:
-                        annotation_id = annotation_response.data[0]["id"]
-                        stored_annotation_ids.append(annotation_id)
-
-                        # Store tactical motifs
-                        if annotation.tactical_motifs:
-                            for motif in annotation.tactical_motifs:
-                                try:
-                                    motif_dict = {
-                                        "annotation_id": annotation_id,
-                                        "motif_type": motif.motif_type,
-                                        "piece": motif.piece,
-                                        "piece_square": motif.piece_square,
-                                        "targets": motif.targets,
-                                        "move": motif.move,
-                                        "description": motif.description,
-                                    }
-
-                                    supabase.table("tactical_motifs").insert(
-                                        motif_dict
-                                    ).execute()
-                                except Exception as motif_err:
-                                    logger.error(
-                                        f"Failed to insert tactical motif {motif.motif_type}: {motif_err}"
-                                    )
-                                    # Continue with the next motif rather than failing the whole transaction
-                    else:
-                        logger.warning(
-                            f"Failed to get ID for inserted annotation for move {annotation.move_san}"
-                        )
-                except Exception as annotation_err:
-                    logger.error(
-                        f"Failed to store annotation for move {annotation.move_san}: {annotation_err}"
-                    )
-                    # Continue with the next annotation rather than failing the whole transaction
+            weaknesses = analysis_result.player_weaknesses
+            weakness_report = {
+                "tactical_weakness": weaknesses.get("tactical") or [],
+                "positional_weakness": weaknesses.get("positional") or [],
+                "opening_weakness": weaknesses.get("opening") or [],
+                "endgame_weakness": weaknesses.get("endgame") or [],
+                "critical_positions": analysis_result.critical_positions or [],
+            }
 
-            # Phase 3: Store player weakness report
-            logger.info("Storing player weakness report")
-            try:
-                # Ensure all fields have values
-                tactical_weakness = analysis_result.player_weaknesses.get(
-                    "tactical", []
-                )
-                positional_weakness = analysis_result.player_weaknesses.get(
-                    "positional", []
-                )
-                opening_weakness = analysis_result.player_weaknesses.get("opening", [])
-                endgame_weakness = analysis_result.player_weaknesses.get("endgame", [])
-
-                # Store player weakness report with default empty arrays for any missing data
-                weakness_dict = {
-                    "user_id": user_id,
-                    "game_id": game_id,
-                    "tactical_weakness": tactical_weakness if tactical_weakness else [],
-                    "positional_weakness": (
-                        positional_weakness if positional_weakness else []
-                    ),
-                    "opening_weakness": opening_weakness if opening_weakness else [],
-                    "endgame_weakness": endgame_weakness if endgame_weakness else [],
-                    "critical_positions": (
-                        analysis_result.critical_positions
-                        if analysis_result.critical_positions
-                        else []
-                    ),
-                }
-
-                weakness_response = (
-                    supabase.table("player_weakness_reports")
-                    .insert(weakness_dict)
-                    .execute()
+            logger.info(
+                f"Storing {len(annotation_rows)} move annotations for game {game_id}"
+            )
+            # Also marks the game as enhanced analyzed and clears its processing flag
+            await execute_query(
+                supabase.rpc(
+                    "store_enhanced_annotations",
+                    {
+                        "p_game_id": game_id,
+                        "p_user_id": user_id,
+                        "p_annotations": annotation_rows,
+                        "p_weakness_report": weakness_report,
+                    },
                 )
-                logger.info(f"Player weakness report stored successfully")
-            except Exception as w_err:
-                logger.error(f"Failed to store player weakness report: {w_err}")
-                # Continue with updating game status rather than failing the whole transaction
-
-            # Phase 4: Mark the game as enhanced analyzed and clear processing flag
-            logger.info(f"Updating game {game_id} status to enhanced_analyzed=True")
-            supabase.table("games").update(
-                {
-                    "enhanced_analyzed": True,
-                    "processing": False,  # Clear processing flag on success
-                }
-            ).eq("id", game_id).execute()
-
-            # If we got here without exceptions, the transaction was successful
+            )
+
             successful_transaction = True
             logger.info(
                 f"Successfully stored all enhanced annotations for game {game_id}"
@@ -556,33 +502,13 @@ async def enhanced_annotate_game(
                 f"Database transaction error while storing enhanced annotations: {db_error}"
             )
 
-            # If we have partial data stored but the transaction failed overall,
-            # attempt to clean up the orphaned data
-            if stored_annotation_ids and not successful_transaction:
-                logger.warning(
-                    f"Transaction failed after storing {len(stored_annotation_ids)} annotations. Cleaning up orphaned data..."
-                )
-                try:
-                    for annotation_id in stored_annotation_ids:
-                        # Clean up tactical motifs first (foreign key constraint)
-                        supabase.table("tactical_motifs").delete().eq(
-                            "annotation_id", annotation_id
-                        ).execute()
-                    # Then clean up annotations
-                    supabase.table("enhanced_move_annotations").delete().eq(
-                        "game_id", game_id
-                    ).execute()
-                    logger.info(
-                        "Successfully cleaned up orphaned data after failed transaction"
-                    )
-                except Exception as cleanup_err:
-                    logger.error(f"Failed to clean up orphaned data: {cleanup_err}")
-
             # Always reset the processing flag if the transaction failed
             try:
-                supabase.table("games").update({"processing": False}).eq(
-                    "id", game_id
-                ).execute()
+                await execute_query(
+                    supabase.table("games")
+                    .update({"processing": False})
+                    .eq("id", game_id)
+                )
                 logger.info(
                     f"Reset processing flag for game {game_id} after failed transaction"
                 )
@@ -591,6 +517,9 @@ async def enhanced_annotate_game(
                     f"Failed to reset processing flag for game {game_id}: {flag_err}"
                 )
 
+        # The stored annotations changed, so don't serve cached ones anymore
+        _analysis_cache.discard_where(lambda key: key[0] == game_id)
+
         # Add transaction status to the result for client-side error handling
         analysis_result.transaction_successful = successful_transaction
         if not successful_transaction and db_error:
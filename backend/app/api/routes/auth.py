@@ -1,10 +1,11 @@
+import asyncio
 import logging
 from typing import Dict, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr, Field
 
-from app.db.supabase import get_supabase_client
+from app.db.supabase import create_auth_client, execute_query
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -45,15 +46,16 @@ async def register(user_data: UserRegisterRequest):
     Returns:
         AuthResponse: Authentication response with token
     """
-    supabase = get_supabase_client()
+    supabase = create_auth_client()
 
     try:
         # Register user with Supabase
-        response = supabase.auth.sign_up(
+        response = await asyncio.to_thread(
+            supabase.auth.sign_up,
             {
                 "email": user_data.email,
                 "password": user_data.password,
-            }
+            },
         )
 
         # Create user profile in the database
@@ -64,7 +66,7 @@ async def register(user_data: UserRegisterRequest):
                 "display_name": user_data.display_name,
             }
 
-            supabase.table("users").insert(user_profile).execute()
+            await execute_query(supabase.table("users").insert(user_profile))
 
             return AuthResponse(
                 access_token=response.session.access_token,
@@ -96,15 +98,16 @@ async def login(credentials: UserLoginRequest):
     Returns:
         AuthResponse: Authentication response with token
     """
-    supabase = get_supabase_client()
+    supabase = create_auth_client()
 
     try:
         # Login user with Supabase
-        response = supabase.auth.sign_in_with_password(
+        response = await asyncio.to_thread(
+            supabase.auth.sign_in_with_password,
             {
                 "email": credentials.email,
                 "password": credentials.password,
-            }
+            },
         )
 
         if response.user:
@@ -136,10 +139,10 @@ async def logout(token: str = Depends(lambda x: x)):
     Returns:
         Dict: Success message
     """
-    supabase = get_supabase_client()
+    supabase = create_auth_client()
 
     try:
-        supabase.auth.sign_out()
+        await asyncio.to_thread(supabase.auth.sign_out)
         return {"message": "Successfully logged out"}
     except Exception as e:
         logger.error(f"Logout error: {str(e)}")
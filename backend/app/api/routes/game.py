@@ -1,20 +1,39 @@
-import io
+import bisect
 import logging
+import os
+import random
 import uuid
 import asyncio
 import time
-from typing import Dict, List, Optional, Union
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
 import chess
-import chess.pgn
+import chess.polyglot
+import orjson
 from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.db.supabase import get_current_user, get_supabase_client
+from app.core.config import Settings, get_settings, settings
+from app.db.supabase import execute_query, get_current_user, get_supabase_client
+from app.services.board_cache import board_from_fen
+from app.services.eval_cache import evaluate_line_with_cache, position_hash
+from app.services.pgn import parse_mainline
 from app.services.stockfish import stockfish_service
 
 router = APIRouter()
 
+# Evaluation in pawns of a mated position, matching the engine's mate_score
+MATE_EVALUATION = 100.0
+
+# Legal moves of the starting position, returned by every new game
+_STARTING_LEGAL_MOVES = [move.uci() for move in chess.Board().legal_moves]
+
+# Polyglot opening book, opened on first use (None if unavailable)
+_opening_book: Optional[chess.polyglot.MemoryMappedReader] = None
+_opening_book_loaded = False
+
 
 class MoveRequest(BaseModel):
     """Request model for making a move."""
@@ -128,6 +147,12 @@ class MoveAnnotation(BaseModel):
     is_book_move: bool = Field(False, description="Whether this is a book move")
 
 
+# move_annotations columns returned by the annotation endpoints
+_ANNOTATION_COLUMNS = ",".join(MoveAnnotation.__fields__)
+# Annotations fetched per request while streaming a game's annotations
+_ANNOTATION_PAGE_SIZE = 100
+
+
 class GameAnnotationResponse(BaseModel):
     """Response model for game annotation."""
 
@@ -137,6 +162,9 @@ class GameAnnotationResponse(BaseModel):
         ..., description="List of move annotations"
     )
 
+    class Config:
+        frozen = True
+
 
 class BatchAnnotationRequest(BaseModel):
     """Request model for batch processing unannotated games."""
@@ -153,31 +181,50 @@ class BatchAnnotationResponse(BaseModel):
     game_ids: List[str] = Field(..., description="List of processed game IDs")
 
 
+class QueueStatusResponse(BaseModel):
+    """Response model for the game processing queue status."""
+
+    queue_size: int = Field(..., description="Number of games waiting in the queue")
+    max_queue_size: int = Field(..., description="Maximum number of queued games")
+    workers: int = Field(..., description="Number of running processing workers")
+
+
 @router.post("/move", response_model=MoveResponse)
-async def make_move(move_request: MoveRequest):
+def make_move(
+    move_request: MoveRequest,
+    include_legal_moves: bool = Query(
+        True, description="Whether to list the legal moves after the move"
+    ),
+):
     """
     Make a move on the chess board.
 
+    Declared without async: the work is CPU-bound python-chess code, so FastAPI
+    runs it in its threadpool instead of blocking the event loop.
+
     Args:
         move_request: Move request with FEN and move
+        include_legal_moves: If False, skip legal move generation and return an empty list
 
     Returns:
         MoveResponse: Updated board state after the move
     """
     try:
         # Create board from FEN
-        board = chess.Board(move_request.fen)
+        board = board_from_fen(move_request.fen)
 
         # Parse and validate move
         move = chess.Move.from_uci(move_request.move)
-        if move not in board.legal_moves:
+        if not board.is_legal(move):
             raise HTTPException(status_code=400, detail="Illegal move")
 
         # Make the move
         board.push(move)
 
-        # Get legal moves after the move
-        legal_moves = [move.uci() for move in board.legal_moves]
+        # Get legal moves after the move (the most expensive step, so opt-out)
+        legal_moves = (
+            [move.uci() for move in board.legal_moves] if include_legal_moves else []
+        )
 
         return MoveResponse(
             fen=board.fen(),
@@ -261,16 +308,142 @@ async def new_game():
     Returns:
         Dict: Initial game state
     """
-    board = chess.Board()
-
     return {
         "id": str(uuid.uuid4()),
-        "fen": board.fen(),
-        "legal_moves": [move.uci() for move in board.legal_moves],
+        "fen": chess.STARTING_FEN,
+        "legal_moves": _STARTING_LEGAL_MOVES,
         "is_game_over": False,
     }
 
 
+def _get_opening_book() -> Optional[chess.polyglot.MemoryMappedReader]:
+    """
+    Get the Polyglot opening book, opening it on first use.
+
+    Returns:
+        Optional[MemoryMappedReader]: The opening book, or None if it is not available
+    """
+    global _opening_book, _opening_book_loaded
+
+    if not _opening_book_loaded:
+        _opening_book_loaded = True
+        path = settings.OPENING_BOOK_PATH
+        if path and os.path.exists(path):
+            try:
+                _opening_book = chess.polyglot.open_reader(path)
+                logging.info(f"Loaded opening book from {path}")
+            except Exception as e:
+                logging.warning(f"Failed to open opening book {path}: {str(e)}")
+        else:
+            logging.info(f"No opening book at {path}, book detection disabled")
+
+    return _opening_book
+
+
+def _is_book_move(
+    book: chess.polyglot.MemoryMappedReader, board: chess.Board, move: chess.Move
+) -> bool:
+    """
+    Check whether a move is listed in the opening book for a position.
+
+    Args:
+        book: Opening book to consult
+        board: Board in the position before the move
+        move: Move to look up
+
+    Returns:
+        bool: True if the book contains the move for this position
+    """
+    return any(entry.move == move for entry in book.find_all(board))
+
+
+def _terminal_evaluation(board: chess.Board) -> Optional[Dict]:
+    """
+    Score a finished position without consulting the engine.
+
+    Checkmate is scored on the same scale the engine uses for mate
+    (mate_score of 10000 centipawns) so evaluation changes stay consistent with
+    engine-scored mating sequences; stalemate and insufficient material are draws.
+
+    Args:
+        board: Board in the position to score
+
+    Returns:
+        Optional[Dict]: Evaluation in the same format as evaluate_position,
+        or None if the game is not over
+    """
+    if board.is_checkmate():
+        # The side to move has been mated
+        evaluation, is_mate, mate_in = -MATE_EVALUATION, True, 0
+    elif board.is_stalemate() or board.is_insufficient_material():
+        evaluation, is_mate, mate_in = 0.0, False, None
+    else:
+        return None
+
+    return {
+        "fen": board.fen(),
+        "evaluation": evaluation,
+        "depth": 0,
+        "is_mate": is_mate,
+        "mate_in": mate_in,
+        "best_move": None,
+    }
+
+
+def _walk_game(
+    board: chess.Board,
+    moves: List[chess.Move],
+    book: Optional[chess.polyglot.MemoryMappedReader],
+) -> Tuple[Tuple[str, int], List[Dict]]:
+    """
+    Play through a game, collecting what annotation needs about every move.
+
+    Args:
+        board: Board at the starting position (modified in place)
+        moves: Mainline moves of the game
+        book: Opening book used to detect book moves, if available
+
+    Returns:
+        Tuple of ((FEN, position hash) of the starting position, list of plies)
+    """
+    start_position = (board.fen(), position_hash(board))
+
+    # Consult the opening book only until the game leaves theory
+    in_book = book is not None
+
+    plies = []
+    # FEN generation dominates the walk, so each position's FEN is built
+    # once and reused as the next move's position before
+    fen_after = start_position[0]
+    for move in moves:
+        color = "white" if board.turn == chess.WHITE else "black"
+        fen_before = fen_after
+
+        # Book moves are sound by definition and skip the engine
+        is_book_move = in_book and _is_book_move(book, board, move)
+        in_book = is_book_move
+
+        # Make the move, deriving its SAN in the same step
+        move_san = board.san_and_push(move)
+        fen_after = board.fen()
+
+        plies.append(
+            {
+                "move_uci": move.uci(),
+                "move_san": move_san,
+                "color": color,
+                "fen_before": fen_before,
+                "fen_after": fen_after,
+                "position_hash": position_hash(board),
+                "is_book_move": is_book_move,
+                # Terminal positions are scored without the engine
+                "terminal": _terminal_evaluation(board),
+            }
+        )
+
+    return start_position, plies
+
+
 @router.post("/{game_id}/annotate", response_model=GameAnnotationResponse)
 async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
     """
@@ -296,7 +469,9 @@ async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
 
     try:
         # Get the game from the database
-        game_response = supabase.table("games").select("*").eq("id", game_id).execute()
+        game_response = await execute_query(
+            supabase.table("games").select("*").eq("id", game_id)
+        )
 
         if len(game_response.data) == 0:
             raise HTTPException(
@@ -314,26 +489,22 @@ async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
 
         # Check if the game is already annotated
         if game.get("analyzed", False):
-            # If already annotated, just return the existing annotations
-            annotations_response = (
-                supabase.table("move_annotations")
-                .select("*")
-                .eq("game_id", game_id)
-                .order("move_number")
-                .execute()
+            # If already annotated, just return the existing annotations,
+            # aggregated into the complete response by the database
+            annotations_response = await execute_query(
+                supabase.rpc("get_game_annotations_json", {"p_game_id": game_id})
             )
+            stored = annotations_response.data[0] if annotations_response.data else None
 
-            if len(annotations_response.data) == 0:
+            if not stored or stored["total_moves"] == 0:
                 # This is an inconsistent state - game marked as analyzed but no annotations
                 logging.warning(
                     f"Game {game_id} marked as analyzed but has no annotations. Proceeding with annotation."
                 )
             else:
-                return GameAnnotationResponse(
-                    game_id=game_id,
-                    total_moves=len(annotations_response.data),
-                    annotations=annotations_response.data,
-                )
+                # Stored rows are trusted, so serialize the document directly
+                # instead of validating every row against the response_model
+                return ORJSONResponse(stored)
 
         # Parse the PGN
         pgn = game.get("pgn") or game.get("moves_only", "")
@@ -343,100 +514,113 @@ async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
                 detail="Game does not contain valid PGN data required for annotation",
             )
 
-        # Parse the game
+        # Parse only the mainline moves; annotation needs no game tree. Parsing
+        # and walking the game are CPU-bound, so they run off the event loop
         try:
-            chess_game = chess.pgn.read_game(io.StringIO(pgn))
+            board, moves = await asyncio.to_thread(parse_mainline, pgn)
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid PGN format: {str(e)}")
 
-        if not chess_game:
+        if not moves:
             raise HTTPException(status_code=400, detail="Invalid or empty PGN data")
 
-        # Initialize board and prepare for annotation
-        board = chess_game.board()
+        # Prepare for annotation
         move_annotations = []
         move_number = 1
 
-        # Process each move in the game
-        for node in chess_game.mainline():
-            move = node.move
-            move_san = board.san(move)
-            move_uci = move.uci()
-            color = "white" if board.turn == chess.WHITE else "black"
-
-            # Get position before the move
-            fen_before = board.fen()
-            try:
-                position_before = await stockfish_service.evaluate_position(fen_before)
-                # Convert evaluation to white's perspective if it's black's turn
-                if not board.turn:  # False means it's black's turn
-                    logging.info(
-                        f"Move {move_number} ({color}): Converting evaluation_before from {position_before['evaluation']} to {-position_before['evaluation']} (black to move)"
-                    )
-                    evaluation_before = -position_before["evaluation"]
-                else:
-                    logging.info(
-                        f"Move {move_number} ({color}): Keeping evaluation_before as {position_before['evaluation']} (white to move)"
-                    )
-                    evaluation_before = position_before["evaluation"]
-            except Exception as e:
-                logging.error(
-                    f"Error evaluating position before move {move_uci}: {str(e)}"
-                )
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Engine error during position evaluation: {str(e)}",
-                )
+        # Walk the game once up front so every position is known before any
+        # engine work starts
+        white_to_move_at_start = board.turn == chess.WHITE
+        start_position, plies = await asyncio.to_thread(
+            _walk_game, board, moves, _get_opening_book()
+        )
+
+        # Evaluate the starting position and every position after a move that
+        # needs the engine, in batches. Quiet positions are only searched at a
+        # shallow depth. Each position after a move is reused as the next
+        # move's position before.
+        positions = [start_position] + [
+            (ply["fen_after"], ply["position_hash"])
+            for ply in plies
+            if ply["terminal"] is None and not ply["is_book_move"]
+        ]
+        try:
+            evaluations = iter(
+                await evaluate_line_with_cache(supabase, positions, game_id)
+            )
+        except Exception as e:
+            logging.error(f"Error evaluating positions of game {game_id}: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail=f"Engine error during position evaluation: {str(e)}",
+            )
+
+        position_before = next(evaluations)
+        # Convert evaluation to white's perspective if it's black's turn
+        evaluation_before = position_before["evaluation"]
+        if not white_to_move_at_start:
+            evaluation_before = -evaluation_before
 
-            # Make the move
-            board.push(move)
+        # Process each move in the game
+        for ply in plies:
+            move_uci = ply["move_uci"]
+            move_san = ply["move_san"]
+            color = ply["color"]
+            fen_before = ply["fen_before"]
+            fen_after = ply["fen_after"]
+            position_hash = ply["position_hash"]
+            is_book_move = ply["is_book_move"]
 
             # Get position after the move
-            fen_after = board.fen()
-            try:
-                position_after = await stockfish_service.evaluate_position(fen_after)
-                # Convert evaluation to white's perspective if it's black's turn
-                if not board.turn:  # False means it's black's turn
-                    logging.info(
-                        f"Move {move_number} ({color}) after: Converting evaluation_after from {position_after['evaluation']} to {-position_after['evaluation']} (black to move)"
-                    )
-                    evaluation_after = -position_after["evaluation"]
-                else:
-                    logging.info(
-                        f"Move {move_number} ({color}) after: Keeping evaluation_after as {position_after['evaluation']} (white to move)"
-                    )
-                    evaluation_after = position_after["evaluation"]
-            except Exception as e:
-                logging.error(
-                    f"Error evaluating position after move {move_uci}: {str(e)}"
-                )
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Engine error during position evaluation: {str(e)}",
-                )
+            if ply["terminal"] is not None:
+                position_after = ply["terminal"]
+            elif is_book_move:
+                # Keep the evaluation, seen from the new side to move
+                position_after = {
+                    "fen": fen_after,
+                    "evaluation": -position_before["evaluation"],
+                    "depth": position_before["depth"],
+                    "is_mate": False,
+                    "mate_in": None,
+                    "best_move": None,
+                }
+            else:
+                position_after = next(evaluations)
+
+            # Convert evaluation to white's perspective if it's black's turn
+            # (after the move, black is to move exactly when white moved)
+            if color == "white":
+                evaluation_after = -position_after["evaluation"]
+            else:
+                evaluation_after = position_after["evaluation"]
 
             # Calculate evaluation change (always from white's perspective for storage)
             evaluation_change = evaluation_after - evaluation_before
-            logging.info(
-                f"Move {move_number} ({color}): Evaluation change from {evaluation_before} to {evaluation_after} = {evaluation_change} (white's perspective)"
-            )
 
             # For classification, adjust based on whose move it was
             if color == "black":
                 classification_change = (
                     -evaluation_change
                 )  # Negate for black's perspective
-                logging.info(
-                    f"Move {move_number} ({color}): Classification change = {classification_change} (black's perspective)"
-                )
             else:
                 classification_change = evaluation_change
-                logging.info(
-                    f"Move {move_number} ({color}): Classification change = {classification_change} (white's perspective)"
-                )
+
+            # Lazily formatted, so this costs next to nothing unless DEBUG is enabled
+            logging.debug(
+                "Move %d (%s) %s: eval %s -> %s (white), change %s (mover)",
+                move_number,
+                color,
+                move_san,
+                evaluation_before,
+                evaluation_after,
+                classification_change,
+            )
 
             # Classify the move based on the player's perspective change
-            classification = classify_move(classification_change)
+            if is_book_move:
+                classification = "book"
+            else:
+                classification = classify_move(classification_change)
 
             # Check if this was the best move
             is_best_move = position_before.get("best_move") == move_uci
@@ -450,29 +634,33 @@ async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
                 "color": color,
                 "fen_before": fen_before,
                 "fen_after": fen_after,
+                "position_hash": position_hash,
                 "evaluation_before": evaluation_before,
                 "evaluation_after": evaluation_after,
                 "evaluation_change": evaluation_change,
                 "classification": classification,
                 "is_best_move": is_best_move,
-                "is_book_move": False,  # Not implementing book detection yet
+                "is_book_move": is_book_move,
             }
 
             move_annotations.append(annotation)
 
+            # Carry this position forward as the next move's position before
+            position_before = position_after
+            evaluation_before = evaluation_after
+
             # Increment move number when it's black's turn (after white's move)
             if color == "black":
                 move_number += 1
 
-        # Store annotations in the database
+        # Store all annotations and mark the game as analyzed in one transaction
         try:
-            for annotation in move_annotations:
-                supabase.table("move_annotations").insert(annotation).execute()
-
-            # Update the game as analyzed
-            supabase.table("games").update({"analyzed": True}).eq(
-                "id", game_id
-            ).execute()
+            await execute_query(
+                supabase.rpc(
+                    "store_game_annotations",
+                    {"p_game_id": game_id, "p_annotations": move_annotations},
+                )
+            )
         except Exception as e:
             logging.error(f"Database error while storing annotations: {str(e)}")
             raise HTTPException(
@@ -480,11 +668,17 @@ async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
                 detail=f"Failed to store annotations in database: {str(e)}",
             )
 
-        # Format the response
-        return GameAnnotationResponse(
-            game_id=game_id,
-            total_moves=len(move_annotations),
-            annotations=move_annotations,
+        # The annotations were just built here, so serialize their response
+        # fields directly instead of validating each one against the response_model
+        return ORJSONResponse(
+            {
+                "game_id": game_id,
+                "total_moves": len(move_annotations),
+                "annotations": [
+                    {name: annotation[name] for name in MoveAnnotation.__fields__}
+                    for annotation in move_annotations
+                ],
+            }
         )
     except HTTPException:
         # Re-raise HTTP exceptions as they're already formatted
@@ -497,51 +691,169 @@ async def annotate_game(game_id: str, user_id: str = Depends(get_current_user)):
 from app.api.routes.analysis import enhanced_annotate_game
 
 
-# Global processing queue and tasks
-_processing_queue = asyncio.Queue()
-_processing_task = None
-_worker_alive = True
-_last_task_failure_time = 0
+# Durable processing queue: queued games are rows of the games table with
+# annotation_queued_at set, so the queue survives restarts and is shared by
+# every API replica. Workers claim games with claim_queued_game, which uses
+# FOR UPDATE SKIP LOCKED so each game is processed by exactly one worker.
+_processing_tasks: List[Optional[asyncio.Task]] = [None] * max(
+    1, settings.ANNOTATION_WORKERS
+)
+# Set when this process queues games, so idle workers don't wait for the next
+# poll; created by the supervisor so it belongs to the running event loop
+_work_available: Optional[asyncio.Event] = None
 
 
-# Function to process games sequentially in the background
-async def _process_games_worker():
-    """Worker function that processes games one at a time."""
-    global _worker_alive
-    
-    logging.info("Game processing worker started")
-    _worker_alive = True
+def queued_at_now() -> str:
+    """Get the current time as an ISO timestamp for annotation_queued_at."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def queued_game_count(supabase) -> int:
+    """
+    Count the games waiting in the processing queue.
+
+    Args:
+        supabase: Supabase client
+
+    Returns:
+        int: Number of queued games
+    """
+    response = await execute_query(
+        supabase.table("games")
+        .select("id", count="exact")
+        .not_.is_("annotation_queued_at", "null")
+        .limit(1)
+    )
+    return response.count or 0
+
+
+def _start_worker(index: int) -> None:
+    """
+    Start (or restart) the processing worker with the given index.
+
+    Args:
+        index: Index of the worker in the pool
+    """
+    task = asyncio.create_task(_process_games_worker(index))
+    task.set_name(f"game_worker_{index}")
+    _processing_tasks[index] = task
+    logging.info(f"Created worker task: {task.get_name()}")
+
+
+async def supervise_processing_workers() -> None:
+    """
+    Run the pool of processing workers until cancelled.
+
+    The pool is only started here, once per process, and a worker that stops
+    unexpectedly is restarted by this task alone. Cancelling the supervisor
+    cancels all workers.
+    """
+    global _work_available
+    _work_available = asyncio.Event()
+
+    for index in range(len(_processing_tasks)):
+        _start_worker(index)
+
+    try:
+        while True:
+            await asyncio.wait(_processing_tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            for index, task in enumerate(_processing_tasks):
+                if not task.done():
+                    continue
+                if not task.cancelled() and task.exception():
+                    logging.error(
+                        f"Worker task {task.get_name()} failed with exception: {task.exception()}"
+                    )
+                logging.warning(f"Worker task {task.get_name()} stopped, restarting it")
+                _start_worker(index)
+
+            # Don't spin if workers keep failing right away
+            await asyncio.sleep(1)
+    finally:
+        for task in _processing_tasks:
+            task.cancel()
+        await asyncio.gather(*_processing_tasks, return_exceptions=True)
+        logging.info("Game processing workers stopped")
+
+
+def running_worker_count() -> int:
+    """Count the processing workers that are running."""
+    return sum(task is not None and not task.done() for task in _processing_tasks)
+
+
+def notify_processing_workers() -> None:
+    """Wake idle workers after games were queued by this process."""
+    if _work_available is not None:
+        _work_available.set()
+
+
+async def _claim_next_game(supabase) -> Optional[Dict]:
+    """
+    Claim the oldest queued game for processing.
+
+    Args:
+        supabase: Supabase client
+
+    Returns:
+        Optional[Dict]: The claimed game row, or None if the queue is empty
+    """
+    response = await execute_query(supabase.rpc("claim_queued_game", {}))
+    return response.data[0] if response.data else None
+
+
+# Function to process games in the background; several workers share the queue
+async def _process_games_worker(index: int = 0):
+    """
+    Worker function that processes queued games one at a time.
+
+    Args:
+        index: Index of the worker in the pool
+    """
+    logging.info(f"Game processing worker {index} started")
     
     # Keep track of consecutive errors
     consecutive_errors = 0
     max_consecutive_errors = 5
+    max_error_delay = 30
+
+    # The shared client keeps its connections alive, so look it up once
+    supabase = get_supabase_client()
+
+    # Idle workers check the queue less often the longer it stays empty; games
+    # queued by this process wake them right away
+    poll_interval = settings.ANNOTATION_POLL_INTERVAL
     
     while True:
         try:
-            # Reset consecutive errors if we get here
+            # Get the next game to process, waiting until one is queued
+            game = await _claim_next_game(supabase)
+            if game is None:
+                try:
+                    await asyncio.wait_for(_work_available.wait(), poll_interval)
+                    poll_interval = settings.ANNOTATION_POLL_INTERVAL
+                except asyncio.TimeoutError:
+                    poll_interval = min(
+                        poll_interval * 2, settings.ANNOTATION_MAX_POLL_INTERVAL
+                    )
+                _work_available.clear()
+                continue
+
+            poll_interval = settings.ANNOTATION_POLL_INTERVAL
+
+            # Reset consecutive errors once the queue is reachable again
             consecutive_errors = 0
-            
-            # Get the next game to process
-            # This will wait indefinitely until a game is available
-            game_id, user_id = await _processing_queue.get()
-            
-            # Log the queue size
-            queue_size = _processing_queue.qsize()
+
+            game_id, user_id = game["id"], game["user_id"]
             processing_start = time.time()
-            logging.info(f"Processing game {game_id} from queue. Queue size: {queue_size}")
+            logging.debug("Worker %d processing game %s from queue", index, game_id)
             
             try:
-                # Double check that the game is marked as processing
-                supabase = get_supabase_client()
-                game_check = supabase.table("games").select("processing").eq("id", game_id).execute()
-                
-                if not game_check.data or not game_check.data[0].get("processing", False):
-                    logging.warning(f"Game {game_id} is not marked as processing. Setting flag.")
-                    supabase.table("games").update({"processing": True}).eq("id", game_id).execute()
-                
+                # The processing flag was set atomically when the game was queued
+
                 # Process the game with wait_for_analysis=True to ensure full processing happens
                 # This is critical - it forces the game to be fully processed, not just queued
-                logging.info(f"Starting analysis for game {game_id}...")
+                logging.debug("Starting analysis for game %s...", game_id)
                 result = await enhanced_annotate_game(
                     game_id=game_id, user_id=user_id, wait_for_analysis=True
                 )
@@ -564,28 +876,27 @@ async def _process_games_worker():
             finally:
                 # Always clear the processing flag regardless of success
                 try:
-                    # Get a fresh client to avoid connection issues
-                    supabase = get_supabase_client()
-                    update_result = supabase.table("games").update({"processing": False}).eq(
-                        "id", game_id
-                    ).execute()
-                    logging.info(f"Reset processing flag for game {game_id}: {len(update_result.data)} rows updated")
+                    update_result = await execute_query(
+                        supabase.table("games")
+                        .update({"processing": False})
+                        .eq("id", game_id)
+                    )
+                    logging.debug(
+                        "Reset processing flag for game %s: %d rows updated",
+                        game_id,
+                        len(update_result.data),
+                    )
                 except Exception as reset_err:
                     logging.error(
                         f"Error resetting processing flag for game {game_id}: {str(reset_err)}"
                     )
                 
-                # Mark this task as done in the queue
-                _processing_queue.task_done()
-                logging.info(f"Marked game {game_id} as done in queue. Remaining queue size: {_processing_queue.qsize()}")
-                
                 # Signal we're ready for the next game
-                logging.info(f"Worker ready for next game")
+                logging.debug("Worker %d ready for next game", index)
                 
         except asyncio.CancelledError:
             # Handle graceful shutdown
-            logging.info("Game processing worker cancelled")
-            _worker_alive = False
+            logging.info(f"Game processing worker {index} cancelled")
             break
         except Exception as e:
             # Handle unexpected errors but never exit the loop
@@ -593,133 +904,22 @@ async def _process_games_worker():
             logging.error(f"Unexpected error in game processing worker: {str(e)}")
             logging.exception("Stack trace for unexpected error:")
             
-            # If we have too many consecutive errors, take a longer break
             if consecutive_errors >= max_consecutive_errors:
                 logging.critical(
                     f"Worker experienced {consecutive_errors} consecutive errors. Taking a longer break."
                 )
-                # Set worker as not alive to trigger restart by the monitor
-                _worker_alive = False
-                await asyncio.sleep(30)
-            else:
-                # Brief pause to avoid tight loops in case of persistent errors
-                await asyncio.sleep(3)
-
-
-# Function to watch the worker task and restart if needed
-async def _ensure_worker_running():
-    """Monitor the worker task and restart it if it fails."""
-    global _processing_task, _worker_alive, _last_task_failure_time
-    
-    while True:
-        try:
-            # Check if the worker task needs to be restarted
-            current_time = time.time()
-            min_restart_wait = 10  # Don't restart more than once every 10 seconds
-            
-            # If the worker is not running and enough time has passed since last failure
-            if (_processing_task is None or _processing_task.done() or not _worker_alive) and (current_time - _last_task_failure_time) > min_restart_wait:
-                logging.warning("Worker task needs restart, creating new worker task")
-                
-                # If there's an existing task, check its status and log any errors
-                if _processing_task and _processing_task.done():
-                    # Check for exceptions in the completed task
-                    try:
-                        error = _processing_task.exception()
-                        if error:
-                            logging.error(f"Previous worker task failed with: {error}")
-                            # Log full stack trace for better debugging
-                            import traceback
-                            tb = "".join(traceback.format_exception(type(error), error, error.__traceback__))
-                            logging.error(f"Worker task exception traceback:\n{tb}")
-                    except (asyncio.InvalidStateError, Exception) as e:
-                        logging.error(f"Error checking worker task exception: {e}")
-                
-                # Register the time we're restarting to avoid frequent restarts
-                _last_task_failure_time = time.time()
-                
-                # Reset the worker state flag
-                _worker_alive = True
-                
-                # Restart the worker
-                _processing_task = asyncio.create_task(_process_games_worker())
-                _processing_task.set_name(f"game_worker_{id(_processing_task)}")
-                
-                # Add a callback to detect when the task fails unexpectedly
-                def on_task_done(task):
-                    global _worker_alive, _last_task_failure_time
-                    if not task.cancelled():
-                        try:
-                            exc = task.exception()
-                            if exc:
-                                logging.error(f"Worker task failed with exception: {exc}")
-                                _worker_alive = False
-                                _last_task_failure_time = time.time()
-                        except (asyncio.CancelledError, asyncio.InvalidStateError):
-                            pass
-                
-                _processing_task.add_done_callback(on_task_done)
-                
-                logging.info(f"Created new worker task: {_processing_task.get_name()}")
-        except Exception as e:
-            logging.error(f"Error in worker watcher: {e}")
-            logging.exception("Stack trace for worker watcher error:")
-        
-        # Check every few seconds
-        await asyncio.sleep(5)
 
-
-# Function to add a game to the processing queue
-async def process_game_async(game_id: str, user_id: str, supabase=None):
-    """
-    Queue a game for processing.
-
-    Args:
-        game_id: ID of the game to process
-        user_id: User ID for authentication
-        supabase: Supabase client (unused, kept for compatibility)
-    """
-    global _processing_task, _worker_alive
-
-    logging.info(f"Received request to queue game {game_id} for user {user_id}")
-
-    # Start the worker task if it's not running
-    if _processing_task is None or _processing_task.done() or not _worker_alive:
-        logging.info("Starting new game processing worker task")
-        _processing_task = asyncio.create_task(_process_games_worker())
-        _processing_task.set_name(f"game_worker_{id(_processing_task)}")
-        
-        # Add a callback to detect when the task fails unexpectedly
-        def on_task_done(task):
-            global _worker_alive, _last_task_failure_time
-            if not task.cancelled():
-                try:
-                    exc = task.exception()
-                    if exc:
-                        logging.error(f"Worker task failed with exception: {exc}")
-                        _worker_alive = False
-                        _last_task_failure_time = time.time()
-                except (asyncio.CancelledError, asyncio.InvalidStateError):
-                    pass
-        
-        _processing_task.add_done_callback(on_task_done)
-        logging.info(f"Created worker task: {_processing_task.get_name()}")
-    else:
-        logging.info(
-            f"Using existing worker task, status: {'running' if not _processing_task.done() else 'completed'}"
-        )
-
-    # Add the game to the queue
-    await _processing_queue.put((game_id, user_id))
-    queue_size = _processing_queue.qsize()
-    logging.info(
-        f"Game {game_id} added to processing queue, current queue size: {queue_size}"
-    )
+            # Back off exponentially up to max_error_delay, with jitter so the
+            # workers of all replicas don't retry a failing database in lockstep
+            delay = min(max_error_delay, 2 ** (consecutive_errors - 1))
+            await asyncio.sleep(delay + random.random())
 
 
 @router.post("/process-unannotated", response_model=BatchAnnotationResponse)
 async def process_unannotated_games(
-    request: BatchAnnotationRequest, user_id: str = Depends(get_current_user)
+    request: BatchAnnotationRequest,
+    user_id: str = Depends(get_current_user),
+    settings: Settings = Depends(get_settings),
 ):
     """
     Process a batch of unannotated games using enhanced analysis.
@@ -727,6 +927,7 @@ async def process_unannotated_games(
     Args:
         request: Batch processing request with limit
         user_id: Current authenticated user
+        settings: Application settings
 
     Returns:
         BatchAnnotationResponse: Summary of processed games
@@ -744,78 +945,39 @@ async def process_unannotated_games(
         logging.info(f"[{request_id}] Processing unannotated games request with limit={request.limit}")
         
         # Check the current processing queue size
-        queue_size = _processing_queue.qsize()
-        logging.info(f"[{request_id}] Current processing queue size: {queue_size}")
-        
-        # First, query for games that need processing
-        # We need to do this in two steps since limit() is not available on update operations
-        query_response = (
-            supabase.table("games")
-            .select("id")
-            .eq("enhanced_analyzed", False)
-            .eq("processing", False)  # Only select games not already being processed
-            .limit(request.limit)
-            .execute()
-        )
-        
-        found_count = len(query_response.data) if query_response.data else 0
-        logging.info(f"[{request_id}] Found {found_count} unprocessed games")
-
-        # Now mark these games as processing one by one
-        games_to_process = []
-        for game in query_response.data:
-            game_id = game["id"]
-            logging.info(f"[{request_id}] Attempting to lock game {game_id} for processing")
-            
-            try:
-                # Mark this game as processing with atomicity check
-                update_response = (
-                    supabase.table("games")
-                    .update({"processing": True})
-                    .eq("id", game_id)
-                    .eq("enhanced_analyzed", False)
-                    .eq("processing", False)  # Only update if it's still not being processed
-                    .execute()
-                )
+        queue_size = await queued_game_count(supabase)
+        logging.debug("[%s] Current processing queue size: %d", request_id, queue_size)
+
+        # Apply backpressure: never queue more games than the queue can hold
+        free_slots = settings.ANNOTATION_QUEUE_SIZE - queue_size
+        if free_slots <= 0:
+            logging.warning(
+                f"[{request_id}] Processing queue is full, rejecting request"
+            )
+            raise HTTPException(
+                status_code=503,
+                detail="Game processing queue is full, please retry later",
+            )
 
-                # Check if the update worked (someone else might have started processing it)
-                if update_response.data and len(update_response.data) > 0:
-                    games_to_process.append(update_response.data[0])
-                    logging.info(f"[{request_id}] Successfully locked game {game_id} for processing")
-                else:
-                    logging.warning(f"[{request_id}] Could not lock game {game_id} - already being processed or was processed")
-            except Exception as lock_error:
-                logging.error(f"[{request_id}] Error locking game {game_id}: {str(lock_error)}")
-                # Continue with the next game rather than failing the whole batch
+        # Lock and queue games that need processing in a single statement;
+        # rows locked by a concurrent request are skipped, so each game is
+        # queued by exactly one request
+        claim_response = await execute_query(
+            supabase.rpc(
+                "claim_unprocessed_games",
+                {"batch_limit": min(request.limit, free_slots)},
+            )
+        )
+        games_to_process = claim_response.data or []
 
         if len(games_to_process) == 0:
             logging.info(f"[{request_id}] No games available for processing")
             return BatchAnnotationResponse(processed_games=0, game_ids=[])
 
-        logging.info(f"[{request_id}] Successfully locked {len(games_to_process)} games for processing")
-
-        # Extract game IDs to return immediately
-        game_ids_to_process = [game_data["id"] for game_data in games_to_process]
-
-        # Start or ensure the worker is running
-        global _processing_task
-        if _processing_task is None or _processing_task.done() or not _worker_alive:
-            logging.info(f"[{request_id}] Starting new worker task for processing")
-            _processing_task = asyncio.create_task(_process_games_worker())
-            _processing_task.set_name(f"game_worker_{id(_processing_task)}")
-        else:
-            logging.info(f"[{request_id}] Using existing worker task {_processing_task.get_name()}")
-
-        # Instead of waiting, add games to the processing queue
-        for game_data in games_to_process:
-            game_id = game_data["id"]
-            # Add to the processing queue
-            await process_game_async(game_id, user_id)
-            logging.info(f"[{request_id}] Added game {game_id} to processing queue")
-
-        final_queue_size = _processing_queue.qsize()
+        game_ids_to_process = [game["id"] for game in games_to_process]
+        notify_processing_workers()
         logging.info(
-            f"[{request_id}] Queued {len(game_ids_to_process)} games for asynchronous processing. Queue size now: {final_queue_size}"
+            f"[{request_id}] Queued {len(game_ids_to_process)} games for asynchronous processing. Queue size now: {queue_size + len(game_ids_to_process)}"
         )
 
         # Return immediately with the list of games being processed
@@ -823,6 +985,9 @@ async def process_unannotated_games(
             processed_games=len(game_ids_to_process), 
             game_ids=game_ids_to_process
         )
+    except HTTPException:
+        # Re-raise HTTP exceptions as they're already formatted
+        raise
     except Exception as e:
         logging.error(f"[{request_id}] Error in batch processing: {str(e)}")
         logging.exception(f"[{request_id}] Stack trace:")
@@ -831,6 +996,67 @@ async def process_unannotated_games(
         )
 
 
+@router.get("/queue-status", response_model=QueueStatusResponse)
+async def get_queue_status(settings: Settings = Depends(get_settings)):
+    """
+    Get the status of the game processing queue.
+
+    Args:
+        settings: Application settings
+
+    Returns:
+        QueueStatusResponse: Current queue depth, capacity and worker count
+    """
+    return QueueStatusResponse(
+        queue_size=await queued_game_count(get_supabase_client()),
+        max_queue_size=settings.ANNOTATION_QUEUE_SIZE,
+        workers=running_worker_count(),
+    )
+
+
+async def _stream_annotations(
+    supabase, game_id: str, first_page: List[Dict]
+) -> AsyncIterator[bytes]:
+    """
+    Stream the annotations of a game as a JSON array, one page at a time.
+
+    Args:
+        supabase: Supabase client
+        game_id: ID of the game
+        first_page: First page of annotations, already fetched by the caller
+
+    Yields:
+        bytes: Chunks of the JSON array
+    """
+    yield b"["
+    page, offset = first_page, 0
+    try:
+        while True:
+            chunk = b",".join(orjson.dumps(row) for row in page)
+            yield chunk if offset == 0 else b"," + chunk
+
+            if len(page) < _ANNOTATION_PAGE_SIZE:
+                break
+            offset += _ANNOTATION_PAGE_SIZE
+            page_response = await execute_query(
+                supabase.table("move_annotations")
+                .select(_ANNOTATION_COLUMNS)
+                .eq("game_id", game_id)
+                .order("move_number")
+                # Both ends of a range are included
+                .range(offset, offset + _ANNOTATION_PAGE_SIZE - 1)
+            )
+            page = page_response.data
+            if not page:
+                break
+    except Exception as e:
+        # The status line is already sent, so leave the array unclosed; the
+        # client then gets invalid JSON instead of a silently truncated list
+        logging.error(f"Error streaming annotations for game {game_id}: {str(e)}")
+        return
+    yield b"]"
+
+
 @router.get("/{game_id}/annotations", response_model=List[MoveAnnotation])
 async def get_game_annotations(game_id: str, user_id: str = Depends(get_current_user)):
     """
@@ -852,9 +1078,15 @@ async def get_game_annotations(game_id: str, user_id: str = Depends(get_current_
     supabase = get_supabase_client()
 
     try:
-        # First check if the game belongs to the user
-        game_response = (
-            supabase.table("games").select("user_id").eq("id", game_id).execute()
+        # Fetch ownership, analysis state and the first page of annotations in
+        # one round-trip by embedding move_annotations in the games query,
+        # selecting exactly the annotation columns of the response model
+        game_response = await execute_query(
+            supabase.table("games")
+            .select(f"user_id, analyzed, move_annotations({_ANNOTATION_COLUMNS})")
+            .eq("id", game_id)
+            .order("move_number", foreign_table="move_annotations")
+            .limit(_ANNOTATION_PAGE_SIZE, foreign_table="move_annotations")
         )
 
         if len(game_response.data) == 0:
@@ -869,21 +1101,11 @@ async def get_game_annotations(game_id: str, user_id: str = Depends(get_current_
                 detail="You don't have permission to access annotations for this game",
             )
 
-        # Get the annotations
-        annotations_response = (
-            supabase.table("move_annotations")
-            .select("*")
-            .eq("game_id", game_id)
-            .order("move_number")
-            .execute()
-        )
+        annotations = game.get("move_annotations") or []
 
-        if len(annotations_response.data) == 0:
+        if len(annotations) == 0:
             # Check if the game is marked as analyzed
-            game_check = (
-                supabase.table("games").select("analyzed").eq("id", game_id).execute()
-            )
-            if game_check.data[0].get("analyzed", False):
+            if game.get("analyzed", False):
                 logging.warning(
                     f"Game {game_id} is marked as analyzed but has no annotations"
                 )
@@ -895,7 +1117,12 @@ async def get_game_annotations(game_id: str, user_id: str = Depends(get_current_
                     detail=f"Game with ID {game_id} has not been analyzed yet",
                 )
 
-        return annotations_response.data
+        # Stored rows are trusted, so they are serialized as they arrive
+        # instead of being validated against the response_model
+        return StreamingResponse(
+            _stream_annotations(supabase, game_id, annotations),
+            media_type="application/json",
+        )
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -946,6 +1173,11 @@ async def get_even_move(request: EvenMoveRequest):
         raise HTTPException(status_code=500, detail=f"Engine error: {str(e)}")
 
 
+# Lower bounds (in pawns) of every classification after the first
+_CLASSIFICATION_THRESHOLDS = (-2.0, -1.0, -0.5, 0.1, 0.5)
+_CLASSIFICATIONS = ("blunder", "mistake", "inaccuracy", "good", "great", "excellent")
+
+
 def classify_move(evaluation_change: float) -> str:
     """
     Classify a move based on evaluation change.
@@ -956,15 +1188,7 @@ def classify_move(evaluation_change: float) -> str:
     Returns:
         str: Classification (blunder, mistake, inaccuracy, good, great, excellent)
     """
-    if evaluation_change < -2.0:
-        return "blunder"
-    elif evaluation_change < -1.0:
-        return "mistake"
-    elif evaluation_change < -0.5:
-        return "inaccuracy"
-    elif evaluation_change < 0.1:
-        return "good"
-    elif evaluation_change < 0.5:
-        return "great"
-    else:
-        return "excellent"
+    # bisect_right so a change exactly on a threshold gets the better class
+    return _CLASSIFICATIONS[
+        bisect.bisect_right(_CLASSIFICATION_THRESHOLDS, evaluation_change)
+    ]
@@ -4,11 +4,14 @@ import chess
 from fastapi import APIRouter, Depends
 from pydantic import BaseModel
 
-from app.core.config import settings
+from app.core.config import Settings, get_settings, settings
 from app.services.stockfish import stockfish_service
 
 router = APIRouter()
 
+# The Stockfish binary doesn't come or go while the process runs, so check once
+_STOCKFISH_AVAILABLE = os.path.exists(settings.STOCKFISH_PATH)
+
 
 class HealthResponse(BaseModel):
     """Health check response model."""
@@ -20,19 +23,19 @@ class HealthResponse(BaseModel):
 
 
 @router.get("/health", response_model=HealthResponse)
-async def health_check():
+async def health_check(settings: Settings = Depends(get_settings)):
     """
     Health check endpoint.
 
+    Args:
+        settings: Application settings
+
     Returns:
         HealthResponse: Health status information
     """
-    # Check if Stockfish is available
-    stockfish_available = os.path.exists(settings.STOCKFISH_PATH)
-
     return HealthResponse(
         status="ok",
         api_version="0.1.0",
-        stockfish_available=stockfish_available,
+        stockfish_available=_STOCKFISH_AVAILABLE,
         environment=settings.ENVIRONMENT,
     )
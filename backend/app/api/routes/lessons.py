@@ -1,7 +1,8 @@
+import asyncio
 import logging
 from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from fastapi.responses import JSONResponse
 
 from app.db.supabase import get_current_user
@@ -15,7 +16,7 @@ router = APIRouter()
 
 @router.get("/", response_model=List[LessonResponse])
 async def get_player_lessons(
-    limit: Optional[int] = 20, user_id: str = Depends(get_current_user)
+    limit: int = Query(20, ge=1, le=100), user_id: str = Depends(get_current_user)
 ):
     """
     Get lessons for the current user.
@@ -32,10 +33,8 @@ async def get_player_lessons(
             status_code=401, detail="Authentication required to access lessons"
         )
 
-    lessons = await lesson_service.get_player_lessons(user_id)
-
-    # Limit the number of lessons returned
-    return lessons[:limit] if lessons else []
+    lessons = await lesson_service.get_player_lessons(user_id, limit)
+    return lessons or []
 
 
 @router.post("/generate", response_model=List[LessonResponse])
@@ -73,24 +72,33 @@ async def generate_lessons(
 
     all_lessons = []
 
-    # Process each game to find blunders and generate lessons
-    for game in games:
-        try:
-            blunders = await lesson_service.get_game_blunders(game["id"], player_id)
+    # Find the blunders of all games concurrently; a failure in one game
+    # comes back as its result instead of cancelling the others. The engine
+    # searches themselves take turns on the main engine
+    blunders_per_game = await asyncio.gather(
+        *(lesson_service.get_game_blunders(game["id"], player_id) for game in games),
+        return_exceptions=True,
+    )
+
+    # Generate lessons from each game's blunders
+    for game, blunders in zip(games, blunders_per_game):
+        # CancelledError is not an Exception, but is returned the same way
+        if isinstance(blunders, BaseException):
+            logger.error(f"Error processing game {game['id']}: {str(blunders)}")
+            # Continue with other games if one fails
+            continue
 
+        try:
             for blunder in blunders:
-                lesson = lesson_service.generate_lesson(blunder)
-
-                # Store lesson in database as a background task
-                background_tasks.add_task(
-                    lesson_service.store_lesson, player_id, lesson
-                )
-
-                all_lessons.append(lesson)
+                all_lessons.append(lesson_service.generate_lesson(blunder))
         except Exception as e:
             logger.error(f"Error processing game {game['id']}: {str(e)}")
             # Continue with other games if one fails
 
+    # Store all lessons in database with one insert as a background task
+    if all_lessons:
+        background_tasks.add_task(lesson_service.store_lessons, player_id, all_lessons)
+
     if not all_lessons:
         return JSONResponse(
             status_code=200,
@@ -4,7 +4,7 @@ from typing import Dict, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr, Field
 
-from app.db.supabase import get_current_user, get_supabase_client
+from app.db.supabase import execute_query, get_current_user, get_supabase_client
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -42,7 +42,9 @@ async def get_current_user_profile(user_id: str = Depends(get_current_user)):
     supabase = get_supabase_client()
 
     try:
-        response = supabase.table("users").select("*").eq("id", user_id).execute()
+        response = await execute_query(
+            supabase.table("users").select("*").eq("id", user_id)
+        )
 
         if response.data and len(response.data) > 0:
             return UserProfile(**response.data[0])
@@ -75,16 +77,16 @@ async def update_current_user_profile(
     supabase = get_supabase_client()
 
     try:
-        # Filter out None values
-        update_data = {k: v for k, v in profile_update.dict().items() if v is not None}
+        # Only the fields the caller supplied, without None values
+        update_data = profile_update.dict(exclude_unset=True, exclude_none=True)
 
         if not update_data:
-            # No fields to update
+            # No fields to update, so a single read of the profile suffices
             return await get_current_user_profile(user_id)
 
         # Update user profile
-        response = (
-            supabase.table("users").update(update_data).eq("id", user_id).execute()
+        response = await execute_query(
+            supabase.table("users").update(update_data).eq("id", user_id)
         )
 
         if response.data and len(response.data) > 0:
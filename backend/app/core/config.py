@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 from typing import List, Union
 
 from pydantic import BaseSettings, validator
@@ -26,10 +27,47 @@ class Settings(BaseSettings):
     STOCKFISH_PATH: str = os.getenv("STOCKFISH_PATH", "/usr/bin/stockfish")
     STOCKFISH_DEPTH: int = 20  # Standard evaluation depth of 20 across all analysis
     STOCKFISH_THREADS: int = 4
+    STOCKFISH_HASH_MB: int = 512  # Transposition table size shared across engines
+    STOCKFISH_POOL_SIZE: int = int(
+        os.getenv("STOCKFISH_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2)))
+    )  # Single-threaded engines used for batch evaluation
+    STOCKFISH_EVAL_CACHE_SIZE: int = int(
+        os.getenv("STOCKFISH_EVAL_CACHE_SIZE", "100000")
+    )  # Slots in the in-process evaluation table (rounded up to a power of two)
+    STOCKFISH_QUICK_DEPTH: int = 6  # First pass depth of adaptive game annotation
+    QUIET_SWING_THRESHOLD: float = 0.5  # Largest swing (pawns) accepted at quick depth
+
+    # Polyglot opening book used to detect book moves during annotation
+    OPENING_BOOK_PATH: str = os.getenv(
+        "OPENING_BOOK_PATH", "data/opening-books/performance.bin"
+    )
+
+    # Game annotation queue (bounded to apply backpressure on batch requests)
+    ANNOTATION_QUEUE_SIZE: int = int(os.getenv("ANNOTATION_QUEUE_SIZE", "16"))
+    # Games annotated concurrently; defaults to one per engine in the pool
+    ANNOTATION_WORKERS: int = int(
+        os.getenv("ANNOTATION_WORKERS", str(STOCKFISH_POOL_SIZE))
+    )
+    # Seconds an idle worker waits before checking the queue again
+    ANNOTATION_POLL_INTERVAL: float = float(os.getenv("ANNOTATION_POLL_INTERVAL", "5"))
+    # Longest wait of a worker that keeps finding the queue empty
+    ANNOTATION_MAX_POLL_INTERVAL: float = float(
+        os.getenv("ANNOTATION_MAX_POLL_INTERVAL", "60")
+    )
+
+    # Seconds a player's lesson lists are served from memory before re-reading them
+    LESSON_CACHE_TTL: float = float(os.getenv("LESSON_CACHE_TTL", "60"))
+    # Seconds a game analysis is served from memory before it is read or computed again
+    ANALYSIS_CACHE_TTL: float = float(os.getenv("ANALYSIS_CACHE_TTL", "300"))
 
     # Supabase
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
+    # Secret Supabase signs access tokens with; when set, tokens are verified
+    # locally instead of by a request to Supabase Auth
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+    # Connections kept open to PostgREST by the shared HTTP client
+    SUPABASE_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
 
     @validator("SUPABASE_URL", "SUPABASE_KEY")
     def validate_supabase_credentials(cls, v, values, **kwargs):
@@ -41,5 +79,19 @@ class Settings(BaseSettings):
         case_sensitive = True
 
 
+@lru_cache()
+def get_settings() -> Settings:
+    """
+    Get the application settings, reading and validating the environment once.
+
+    Route handlers receive the settings through Depends(get_settings), so tests
+    can swap them with app.dependency_overrides.
+
+    Returns:
+        Settings: Application settings
+    """
+    return Settings()
+
+
 # Create settings instance
-settings = Settings()
+settings = get_settings()
@@ -1,9 +1,21 @@
+import asyncio
+import hashlib
 import logging
 import os
-from typing import Optional
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from json import JSONDecodeError
+from typing import Any, Optional, Tuple
 
+import httpx
+import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from gotrue.http_clients import SyncClient
+from postgrest.base_request_builder import APIResponse
+from postgrest.exceptions import APIError, generate_default_error_message
+from pydantic import ValidationError
 from supabase import Client, create_client
 
 from app.core.config import settings
@@ -13,27 +25,201 @@ logger = logging.getLogger(__name__)
 # Security scheme for JWT authentication
 security = HTTPBearer()
 
+# Maximum number of verified access tokens kept in memory
+MAX_CACHED_TOKENS = 1024
+
+# User IDs of recently verified access tokens by token digest, each with the
+# expiry time of its token
+_token_cache: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+
+# HTTP client used to send Supabase queries, see _get_http_client
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Connection pool shared by the auth requests of every Supabase client; auth
+# calls run in worker threads, which the sync HTTP client supports
+_auth_http_client = SyncClient(
+    limits=httpx.Limits(
+        max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.SUPABASE_MAX_CONNECTIONS,
+    )
+)
+
+
+def _create_client() -> Client:
+    """
+    Create a Supabase client whose auth requests use the shared connection pool.
+
+    Returns:
+        Client: Supabase client
+    """
+    client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+    # The auth client otherwise opens (and never closes) its own HTTP client
+    client.auth._http_client = _auth_http_client
+    return client
+
+
+@lru_cache(maxsize=1)
+def _shared_client() -> Client:
+    """Create the Supabase client shared by all requests."""
+    return _create_client()
+
 
 def get_supabase_client() -> Client:
     """
-    Get a Supabase client instance.
+    Get the shared Supabase client instance.
+
+    The client is created once per process so every request reuses its HTTP
+    connection pool. It never signs in, so it always acts with the service key.
 
     Returns:
         Client: Supabase client
     """
     try:
-        return create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        return _shared_client()
     except Exception as e:
         logger.error(f"Failed to create Supabase client: {str(e)}")
         raise RuntimeError(f"Failed to create Supabase client: {str(e)}")
 
 
+def create_auth_client() -> Client:
+    """
+    Create a new Supabase client for sign up, sign in and sign out.
+
+    These calls store a user session on the client, so each request gets its
+    own client instead of changing the session of the shared one.
+
+    Returns:
+        Client: Supabase client
+    """
+    try:
+        return _create_client()
+    except Exception as e:
+        logger.error(f"Failed to create Supabase client: {str(e)}")
+        raise RuntimeError(f"Failed to create Supabase client: {str(e)}")
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """
+    Get the HTTP client shared by all Supabase queries.
+
+    The client is created on first use, inside the running event loop, and
+    keeps a bounded pool of HTTP/2 connections to PostgREST alive.
+
+    Returns:
+        httpx.AsyncClient: Shared HTTP client
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.SUPABASE_MAX_CONNECTIONS,
+            ),
+        )
+    return _http_client
+
+
+async def close_http_clients() -> None:
+    """Close the shared HTTP clients and their connections."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    _auth_http_client.close()
+
+
+async def execute_query(query: Any) -> APIResponse:
+    """
+    Execute a Supabase query without blocking the event loop.
+
+    The Supabase client only performs synchronous HTTP requests, so the request
+    the query builder prepared is sent through the shared async HTTP client
+    instead, with the URL and headers of the builder's own session.
+
+    Args:
+        query: Query builder, e.g. supabase.table("games").select("*")
+
+    Returns:
+        APIResponse: The query response
+
+    Raises:
+        APIError: If PostgREST returned an error
+    """
+    session = query.session
+    headers = session.headers.copy()
+    headers.update(query.headers)
+
+    response = await _get_http_client().request(
+        query.http_method,
+        f"{str(session.base_url).rstrip('/')}{query.path}",
+        json=query.json,
+        params=query.params,
+        headers=headers,
+        timeout=session.timeout,
+    )
+
+    # Same response handling as the query builder's own execute()
+    try:
+        if 200 <= response.status_code <= 299:
+            return APIResponse.from_http_request_response(response)
+        raise APIError(response.json())
+    except ValidationError as e:
+        raise APIError(response.json()) from e
+    except JSONDecodeError:
+        raise APIError(generate_default_error_message(response))
+
+
+def _verify_token(token: str) -> str:
+    """
+    Verify a Supabase access token with the JWT secret, without a network call.
+
+    Verified tokens are kept in a small LRU cache until they expire, so
+    concurrent requests of the same client only decode their token once.
+
+    Args:
+        token: Access token of the request
+
+    Returns:
+        str: ID of the user the token was issued to
+
+    Raises:
+        jwt.InvalidTokenError: If the token is invalid or expired
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    entry = _token_cache.get(digest)
+    if entry is not None:
+        expires_at, user_id = entry
+        if expires_at > time.time():
+            _token_cache.move_to_end(digest)
+            return user_id
+        del _token_cache[digest]
+
+    payload = jwt.decode(
+        token,
+        settings.SUPABASE_JWT_SECRET,
+        algorithms=["HS256"],
+        audience="authenticated",
+        options={"require": ["exp", "sub"]},
+    )
+    user_id = payload["sub"]
+
+    _token_cache[digest] = (payload["exp"], user_id)
+    if len(_token_cache) > MAX_CACHED_TOKENS:
+        _token_cache.popitem(last=False)
+
+    return user_id
+
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ) -> str:
     """
     Get the current authenticated user from the JWT token.
 
+    With settings.SUPABASE_JWT_SECRET set the token is verified locally,
+    otherwise Supabase Auth is asked to verify it.
+
     Args:
         credentials: HTTP Authorization credentials
 
@@ -41,11 +227,23 @@ async def get_current_user(
         str: User ID
     """
     token = credentials.credentials
+
+    if settings.SUPABASE_JWT_SECRET:
+        try:
+            return _verify_token(token)
+        except jwt.InvalidTokenError as e:
+            logger.error(f"Authentication error: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid authentication credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
     supabase = get_supabase_client()
 
     try:
         # Verify the token and get user data
-        response = supabase.auth.get_user(token)
+        response = await asyncio.to_thread(supabase.auth.get_user, token)
 
         if response and response.user:
             return response.user.id
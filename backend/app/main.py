@@ -1,16 +1,17 @@
 import os
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from contextlib import AsyncExitStack, asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from fastapi.background import BackgroundTasks
 
 from app.api.routes import analysis, auth, game, health, lessons, user
 from app.core.config import settings
-from app.db.supabase import get_supabase_client
+from app.db.supabase import close_http_clients
 
 # Load environment variables
 load_dotenv()
@@ -18,20 +19,64 @@ load_dotenv()
 # Configure logging
 logger = logging.getLogger(__name__)
 
+
+# Seconds shutdown waits for background tasks to finish their cleanup
+SHUTDOWN_TIMEOUT = 10
+
+
+async def _stop_task(task: asyncio.Task) -> None:
+    """Cancel a background task and wait, up to SHUTDOWN_TIMEOUT, for its cleanup."""
+    task.cancel()
+    done, _ = await asyncio.wait({task}, timeout=SHUTDOWN_TIMEOUT)
+    if not done:
+        logger.warning(
+            f"Task {task.get_name()} did not stop within {SHUTDOWN_TIMEOUT} seconds"
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Run the background tasks and shared connections for the lifetime of the app.
+
+    Cleanup callbacks run in reverse order of registration, so the workers are
+    stopped before the Supabase connections they use are closed.
+    """
+    async with AsyncExitStack() as stack:
+        # Close the connections kept open to Supabase
+        stack.push_async_callback(close_http_clients)
+
+        # Start the supervised pool of game processing workers
+        supervisor = asyncio.create_task(game.supervise_processing_workers())
+        supervisor.set_name("game_worker_supervisor")
+        stack.push_async_callback(_stop_task, supervisor)
+        logger.info("Started game processing workers")
+
+        yield
+
+        logger.info("Application shutting down, cleaning up resources")
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Chess Tutor API",
     description="Backend API for the Chess Tutor application",
     version="0.1.0",
+    lifespan=lifespan,
+    # orjson serializes large annotation payloads much faster than stdlib json
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.CORS_ORIGINS,
+    # Origins are checked on every cross-origin request, so use a set lookup
+    allow_origins=frozenset(settings.CORS_ORIGINS),
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
+    # Headers the frontend sends; an explicit list avoids echoing back whatever
+    # headers each preflight request asks for
+    allow_headers=["Authorization", "Content-Type", "apikey", "X-Client-Info"],
     max_age=86400,  # 24 hours
 )
 
@@ -48,93 +93,3 @@ app.include_router(lessons.router, prefix="/lessons", tags=["Lessons"])
 async def root():
     """Root endpoint for the Chess Tutor API."""
     return {"message": "Welcome to the Chess Tutor API!"}
-
-
-# Background task to reset stale processing flags
-async def reset_stale_processing_flags():
-    """
-    Reset processing flags for games that have been stuck in processing state.
-    This helps recover from crashes or timeouts.
-    """
-    try:
-        while True:
-            try:
-                logger.info("Checking for stale processing flags...")
-                # Get Supabase client
-                supabase = get_supabase_client()
-
-                # Find games that are stuck in processing state
-                stuck_games = (
-                    supabase.table("games")
-                    .select("id")
-                    .eq("processing", True)
-                    .execute()
-                )
-
-                # Reset each stuck game
-                reset_count = 0
-                for game in stuck_games.data:
-                    supabase.table("games").update({"processing": False}).eq(
-                        "id", game["id"]
-                    ).execute()
-                    reset_count += 1
-
-                if reset_count > 0:
-                    logger.info(f"Reset processing flag for {reset_count} stale games")
-
-            except Exception as e:
-                logger.error(f"Error in reset_stale_processing_flags: {e}")
-
-            # Run once every hour
-            await asyncio.sleep(3600)
-    except asyncio.CancelledError:
-        # Task was cancelled, clean up resources
-        logger.info("Stale flag cleanup task was cancelled")
-
-
-# Start background tasks
-@app.on_event("startup")
-async def startup_event():
-    """Start background tasks when the application starts."""
-    # Start the task to reset stale processing flags
-    asyncio.create_task(reset_stale_processing_flags())
-    
-    # Start the game processing worker monitor
-    try:
-        # Import first to check if module exists
-        from app.api.routes import game
-        
-        # Create and start the monitor task
-        monitor_task = asyncio.create_task(game._ensure_worker_running())
-        monitor_task.set_name("game_worker_monitor")
-        logger.info("Started game processing worker monitor")
-    except Exception as e:
-        logger.warning(f"Could not start game processing worker monitor: {e}")
-        logger.exception("Stack trace for monitor start error:")
-
-
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Clean up resources when the application shuts down."""
-    logger.info("Application shutting down, cleaning up resources")
-    
-    # If there's a game processing queue in the game routes module, cancel its worker task
-    try:
-        # Import the module, not just the variable
-        from app.api.routes import game
-
-        if hasattr(game, '_processing_task') and game._processing_task and not game._processing_task.done():
-            logger.info("Cancelling game processing worker task")
-            game._processing_task.cancel()
-            logger.info("Game processing worker task cancelled")
-        else:
-            logger.info("No active game processing worker task to cancel")
-            
-        # Set worker_alive to False to prevent any automatic restarts
-        if hasattr(game, '_worker_alive'):
-            game._worker_alive = False
-            logger.info("Set worker_alive flag to False")
-            
-    except Exception as e:
-        logger.warning(f"Could not access game processing task: {e}")
-        logger.exception("Stack trace for shutdown error:")
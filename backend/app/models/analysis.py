@@ -1,38 +1,200 @@
+from enum import IntEnum
 from typing import Any, Dict, List, Optional, Tuple, Union
 
+import chess
 import numpy as np
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, root_validator, validator
+
+# Square control grids in the order they are stacked in SquareControl.control
+CONTROL_GRIDS = (
+    "white_control",
+    "black_control",
+    "white_control_material",
+    "black_control_material",
+)
+
+_EMPTY_GRID = [[0] * 8] * 8
+
+# Control grids of a SquareControl without any control. SquareControl is
+# immutable, so every default instance shares this read-only block
+_NO_CONTROL = np.zeros((4, 8, 8), dtype=np.int8)
+_NO_CONTROL.setflags(write=False)
+
+
+class ControlGrids(np.ndarray):
+    """
+    int8 array of shape (4, 8, 8) holding the square control grids.
+
+    Grids are indexed [grid][rank][file], in the order of CONTROL_GRIDS. The
+    largest possible value (material of every attacker of a square) stays
+    well below the int8 limit.
+    """
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def validate(cls, value: Any) -> np.ndarray:
+        array = np.asarray(value, dtype=np.int8)
+        if array.shape != (4, 8, 8):
+            raise ValueError(
+                f"Expected control grids of shape (4, 8, 8), got {array.shape}"
+            )
+        return array
+
+    @classmethod
+    def __modify_schema__(cls, field_schema: Dict[str, Any]) -> None:
+        row = {"type": "array", "items": {"type": "integer"}}
+        field_schema.update(type="array", items={"type": "array", "items": row})
 
 
 class SquareControl(BaseModel):
-    """Model for tracking square control metrics."""
+    """
+    Model for tracking square control metrics.
 
-    white_control: List[List[int]] = Field(
-        default_factory=lambda: [[0 for _ in range(8)] for _ in range(8)]
-    )
-    black_control: List[List[int]] = Field(
-        default_factory=lambda: [[0 for _ in range(8)] for _ in range(8)]
-    )
-    white_control_material: List[List[int]] = Field(
-        default_factory=lambda: [[0 for _ in range(8)] for _ in range(8)]
-    )
-    black_control_material: List[List[int]] = Field(
-        default_factory=lambda: [[0 for _ in range(8)] for _ in range(8)]
-    )
+    The four control grids are stored as one contiguous int8 array, so whole
+    grids can be compared with vectorized operations. They are still read and
+    written as four 8x8 lists of ints in JSON.
+    """
+
+    control: ControlGrids = Field(default_factory=lambda: _NO_CONTROL)
     white_legal_moves: Dict[str, List[str]] = Field(default_factory=dict)
     black_legal_moves: Dict[str, List[str]] = Field(default_factory=dict)
 
+    class Config:
+        allow_mutation = False
+        json_encoders = {np.ndarray: lambda array: array.tolist()}
+
+        @staticmethod
+        def schema_extra(schema: Dict[str, Any], model: Any) -> None:
+            grid = schema["properties"].pop("control")["items"]
+            schema["properties"] = {
+                **{
+                    name: {"title": name.replace("_", " ").title(), **grid}
+                    for name in CONTROL_GRIDS
+                },
+                **schema["properties"],
+            }
+
+    @root_validator(pre=True)
+    def stack_control_grids(cls, values):
+        """Accept the four grids of the JSON representation in place of control."""
+        if "control" not in values and any(name in values for name in CONTROL_GRIDS):
+            values = dict(values)
+            values["control"] = [
+                values.pop(name, _EMPTY_GRID) for name in CONTROL_GRIDS
+            ]
+        return values
+
+    def dict(self, **kwargs) -> Dict[str, Any]:
+        """Get the model as a dict, with the four control grids as nested lists."""
+        data = super().dict(**kwargs)
+        control = data.pop("control", None)
+        if control is not None:
+            data = {**dict(zip(CONTROL_GRIDS, control.tolist())), **data}
+        return data
+
+    @property
+    def white_control(self) -> np.ndarray:
+        """Number of white pieces attacking each square, indexed [rank][file]."""
+        return self.control[0]
+
+    @property
+    def black_control(self) -> np.ndarray:
+        """Number of black pieces attacking each square, indexed [rank][file]."""
+        return self.control[1]
+
+    @property
+    def white_control_material(self) -> np.ndarray:
+        """Material value of the white pieces attacking each square."""
+        return self.control[2]
+
+    @property
+    def black_control_material(self) -> np.ndarray:
+        """Material value of the black pieces attacking each square."""
+        return self.control[3]
+
+
+class MotifType(IntEnum):
+    """Types of tactical patterns, named "fork", "pin" etc. in JSON."""
+
+    FORK = 0
+    PIN = 1
+    SKEWER = 2
+    DISCOVERED_CHECK = 3
+
+    @property
+    def label(self) -> str:
+        """Name of the motif type used in JSON and the database."""
+        return self.name.lower()
+
 
 class TacticalMotif(BaseModel):
-    """Model for a detected tactical pattern."""
+    """
+    Model for a detected tactical pattern.
 
-    motif_type: str  # "fork", "pin", "skewer", "discovered_check"
+    The motif type is kept as a MotifType and squares as indexes 0-63, while
+    JSON and the database use motif names and square names like "e4". Targets
+    are a tuple, which takes less memory than a list and can't be changed.
+    """
+
+    motif_type: MotifType
     piece: str  # Piece performing the tactic
-    piece_square: str  # Square of the piece doing the tactic
-    targets: List[str]  # Target squares/pieces
+    piece_square: int  # Square of the piece doing the tactic
+    targets: Tuple[int, ...]  # Target squares
     move: str  # The move that created the tactic (UCI format)
     description: str  # Human-readable description
 
+    class Config:
+        allow_mutation = False
+
+        @staticmethod
+        def schema_extra(schema: Dict[str, Any], model: Any) -> None:
+            properties = schema["properties"]
+            properties["motif_type"] = {
+                "title": "Motif Type",
+                "type": "string",
+                "enum": [motif_type.label for motif_type in MotifType],
+            }
+            properties["piece_square"] = {"title": "Piece Square", "type": "string"}
+            properties["targets"] = {
+                "title": "Targets",
+                "type": "array",
+                "items": {"type": "string"},
+            }
+
+    @validator("motif_type", pre=True)
+    def parse_motif_type(cls, value):
+        """Accept motif type names like "fork"."""
+        if isinstance(value, str):
+            return MotifType[value.upper()]
+        return value
+
+    @validator("piece_square", pre=True)
+    def parse_piece_square(cls, value):
+        """Accept square names like "e4"."""
+        return chess.parse_square(value) if isinstance(value, str) else value
+
+    @validator("targets", pre=True)
+    def parse_targets(cls, value):
+        """Accept square names like "e4"."""
+        return tuple(
+            chess.parse_square(square) if isinstance(square, str) else square
+            for square in value
+        )
+
+    def dict(self, **kwargs) -> Dict[str, Any]:
+        """Get the model as a dict, with the motif type and squares as names."""
+        data = super().dict(**kwargs)
+        if "motif_type" in data:
+            data["motif_type"] = self.motif_type.label
+        if "piece_square" in data:
+            data["piece_square"] = chess.SQUARE_NAMES[self.piece_square]
+        if "targets" in data:
+            data["targets"] = [chess.SQUARE_NAMES[square] for square in self.targets]
+        return data
+
 
 class PositionAnalysis(BaseModel):
     """Enhanced position analysis with tactical motifs and square control."""
@@ -51,7 +213,12 @@ class PositionAnalysis(BaseModel):
 
 
 class MoveAnalysis(BaseModel):
-    """Enhanced move analysis with tactical annotations."""
+    """
+    Enhanced move analysis with tactical annotations.
+
+    The evaluation change is derived from the evaluations before and after the
+    move, so it can't disagree with them. It is still included in JSON.
+    """
 
     move_uci: str
     move_san: str
@@ -60,23 +227,49 @@ class MoveAnalysis(BaseModel):
     fen_after: str
     evaluation_before: float
     evaluation_after: float
-    evaluation_change: float
     classification: str
     is_best_move: bool
     is_book_move: bool
     best_move: Optional[str] = None  # Stockfish's calculated best move at depth 20
     tactical_motifs: List[TacticalMotif] = Field(default_factory=list)
-    square_control_before: SquareControl
+    # The control before a move is the control after the previous one, see
+    # GameAnalysisResult.square_control_before
     square_control_after: SquareControl
     move_improvement: Optional[str] = None  # Suggestion for improvement
 
+    class Config:
+        allow_mutation = False
+
+        @staticmethod
+        def schema_extra(schema: Dict[str, Any], model: Any) -> None:
+            schema["properties"]["evaluation_change"] = {
+                "title": "Evaluation Change",
+                "type": "number",
+                "readOnly": True,
+            }
+
+    @property
+    def evaluation_change(self) -> float:
+        """Change in evaluation caused by the move, from white's perspective."""
+        return self.evaluation_after - self.evaluation_before
+
+    def dict(self, **kwargs) -> Dict[str, Any]:
+        """Get the model as a dict, including the evaluation change."""
+        data = super().dict(**kwargs)
+        if "evaluation_after" in data and "evaluation_before" in data:
+            data["evaluation_change"] = self.evaluation_change
+        return data
+
 
 class GameAnalysisResult(BaseModel):
     """Complete game analysis with tactical and positional insights."""
 
     game_id: str
     total_moves: int = 0
-    annotations: List[MoveAnalysis] = []
+    # A tuple is smaller than a list, and annotations aren't added after analysis
+    annotations: Tuple[MoveAnalysis, ...] = ()
+    # Square control before the first move
+    initial_square_control: Optional[SquareControl] = None
     player_weaknesses: Dict[str, List[int]] = Field(
         default_factory=lambda: {
             "tactical": [],
@@ -94,3 +287,18 @@ class GameAnalysisResult(BaseModel):
     transaction_error: Optional[str] = None  # Error message if transaction failed
     status: str = "complete"  # Status: "processing" or "complete"
     message: Optional[str] = None  # Optional status message
+
+    def square_control_before(self, index: int) -> Optional[SquareControl]:
+        """
+        Get the square control before a move.
+
+        Args:
+            index: Index of the move in annotations
+
+        Returns:
+            Optional[SquareControl]: Control after the previous move, or the
+            initial control for the first move
+        """
+        if index == 0:
+            return self.initial_square_control
+        return self.annotations[index - 1].square_control_after
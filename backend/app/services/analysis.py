@@ -1,9 +1,12 @@
+import bisect
 import io
 import logging
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple, Union
 
 import chess
 import chess.pgn
+import numpy as np
 from chess.pgn import (
     NAG_BLUNDER,
     NAG_BRILLIANT_MOVE,
@@ -13,6 +16,7 @@ from chess.pgn import (
     NAG_SPECULATIVE_MOVE,
 )
 
+from app.db.supabase import get_supabase_client
 from app.models.analysis import (
     GameAnalysisResult,
     MoveAnalysis,
@@ -20,12 +24,21 @@ from app.models.analysis import (
     SquareControl,
     TacticalMotif,
 )
+from app.services.board_cache import board_from_fen
+from app.services.eval_cache import evaluate_positions_with_cache, position_hash
 from app.services.stockfish import stockfish_service
 from app.services.tactics import tactics_service
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Depth at which the best move stored with each annotation is searched
+BEST_MOVE_DEPTH = 20
+
+# Game analysis only uses the evaluation, best move and square control of each
+# position; the tactics of the move actually played are detected separately
+_EVALUATION_ONLY = {"include_tactics": False, "include_critical": False}
+
 # NAG (Numeric Annotation Glyph) to symbol mapping
 NAG_SYMBOLS = {
     NAG_GOOD_MOVE: "!",  # Good move
@@ -61,6 +74,12 @@ def get_nag_for_evaluation_change(evaluation_change: float) -> int:
         return NAG_BRILLIANT_MOVE  # !!
 
 
+# Lower bounds (in pawns) of every classification after the first, matching
+# the NAG thresholds of get_nag_for_evaluation_change
+_CLASSIFICATION_THRESHOLDS = (-2.0, -1.0, -0.5, 0.1, 0.5)
+_CLASSIFICATIONS = ("blunder", "mistake", "inaccuracy", "good", "great", "excellent")
+
+
 def classify_move(evaluation_change: float) -> str:
     """
     Classify a move based on evaluation change.
@@ -71,24 +90,10 @@ def classify_move(evaluation_change: float) -> str:
     Returns:
         str: Classification (blunder, mistake, inaccuracy, good, great, excellent)
     """
-    # Get NAG for this evaluation change
-    nag = get_nag_for_evaluation_change(evaluation_change)
-
-    # Map NAG to string classification (for backward compatibility)
-    if nag == NAG_BLUNDER:
-        return "blunder"
-    elif nag == NAG_MISTAKE:
-        return "mistake"
-    elif nag == NAG_DUBIOUS_MOVE:
-        return "inaccuracy"
-    elif nag == NAG_GOOD_MOVE:
-        return (
-            "good" if evaluation_change < 0.1 else "great"
-        )  # Distinguish between good and great
-    elif nag == NAG_BRILLIANT_MOVE:
-        return "excellent"
-    else:
-        return "good"  # Default case
+    # bisect_right so a change exactly on a threshold gets the better class
+    return _CLASSIFICATIONS[
+        bisect.bisect_right(_CLASSIFICATION_THRESHOLDS, evaluation_change)
+    ]
 
 
 def get_move_symbol(evaluation_change: float) -> str:
@@ -105,11 +110,135 @@ def get_move_symbol(evaluation_change: float) -> str:
     return NAG_SYMBOLS.get(nag, "")
 
 
+def _fallback_position(fen: str, square_control: SquareControl) -> PositionAnalysis:
+    """
+    Get a neutral analysis of a position whose analysis failed.
+
+    Args:
+        fen: FEN of the position
+        square_control: Square control of the position
+
+    Returns:
+        PositionAnalysis: Analysis with a neutral evaluation and the given
+        square control
+    """
+    return PositionAnalysis.construct(
+        fen=fen,
+        evaluation=0.0,  # Neutral evaluation
+        depth=0,
+        is_mate=False,
+        mate_in=None,
+        best_move=None,
+        square_control=square_control,
+        tactical_motifs=[],
+        critical_squares=[],
+    )
+
+
 class AnalysisService:
     """Enhanced chess position and game analysis service."""
 
+    # Maximum number of position analyses kept in memory
+    MAX_CACHED_POSITIONS = 4096
+    # Maximum number of square control grids kept in memory
+    MAX_CACHED_SQUARE_CONTROLS = 4096
+
+    def __init__(self):
+        # Position analyses by (Zobrist hash, depth, include_tactics,
+        # include_critical), in least recently used order
+        self._position_cache: "OrderedDict[Tuple, PositionAnalysis]" = OrderedDict()
+        # Square control by Zobrist hash, in least recently used order. It
+        # doesn't depend on the search depth or the analysis options, so it is
+        # shared by all analyses of a position, including the fallback ones
+        self._square_control_cache: "OrderedDict[int, SquareControl]" = OrderedDict()
+
+    def _position_cache_key(
+        self,
+        board: chess.Board,
+        depth: Optional[int],
+        include_tactics: bool = True,
+        include_critical: bool = True,
+    ) -> Tuple:
+        """
+        Get the key of a position analysis in the position cache.
+
+        Repeated positions and transpositions share their analysis; the Zobrist
+        hash ignores the move counters of the FEN.
+
+        Args:
+            board: Board in the position
+            depth: Search depth (defaults to settings.STOCKFISH_DEPTH)
+            include_tactics: Whether the analysis includes best move tactics
+            include_critical: Whether the analysis includes critical squares
+
+        Returns:
+            Tuple: Cache key
+        """
+        return (
+            position_hash(board),
+            depth or stockfish_service.depth,
+            include_tactics,
+            include_critical,
+        )
+
+    def _square_control(
+        self, board: chess.Board, key: Optional[int] = None
+    ) -> SquareControl:
+        """
+        Get the square control of a position, calculating it once per position.
+
+        SquareControl is immutable, so the cached instance is shared.
+
+        Args:
+            board: Board in the position, which is not modified
+            key: Zobrist hash of the position, if already known
+
+        Returns:
+            SquareControl: Square control of the position
+        """
+        if key is None:
+            key = position_hash(board)
+        square_control = self._square_control_cache.get(key)
+        if square_control is not None:
+            self._square_control_cache.move_to_end(key)
+            return square_control
+
+        square_control = tactics_service.calculate_square_control(board)
+        self._square_control_cache[key] = square_control
+        if len(self._square_control_cache) > self.MAX_CACHED_SQUARE_CONTROLS:
+            self._square_control_cache.popitem(last=False)
+        return square_control
+
+    def _cached_position(
+        self, cache_key: Tuple, fen: str
+    ) -> Optional[PositionAnalysis]:
+        """
+        Get a cached position analysis without going through a coroutine.
+
+        Args:
+            cache_key: Key from _position_cache_key
+            fen: FEN of the position, which may differ from the cached one in
+                 its move counters
+
+        Returns:
+            Optional[PositionAnalysis]: The cached analysis, or None
+        """
+        cached = self._position_cache.get(cache_key)
+        if cached is None:
+            return None
+        self._position_cache.move_to_end(cache_key)
+        if cached.fen == fen:
+            return cached
+        return cached.copy(update={"fen": fen})
+
     async def analyze_position(
-        self, fen: str, depth: Optional[int] = None
+        self,
+        fen: str,
+        depth: Optional[int] = None,
+        evaluation: Optional[Dict] = None,
+        *,
+        include_tactics: bool = True,
+        include_critical: bool = True,
     ) -> PositionAnalysis:
         """
         Analyze a chess position with enhanced metrics.
@@ -119,30 +248,87 @@ class AnalysisService:
         Args:
             fen: FEN notation of the position to analyze
             depth: Search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
+            evaluation: Optional engine evaluation of the position that was
+                        already computed; skips the engine call
+            include_tactics: Whether to look for tactical motifs in the best move
+            include_critical: Whether to identify critical squares
 
         Returns:
-            PositionAnalysis: Detailed position analysis with square control metrics
+            PositionAnalysis: Detailed position analysis with square control
+            metrics. Analyses are cached and shared, so callers must not modify it
         """
+        # Create board from FEN
         try:
-            logger.info(
-                f"Analyzing position: {fen} at depth {depth or stockfish_service.depth}"
-            )
+            board = board_from_fen(fen)
+        except ValueError as e:
+            logger.error(f"Invalid FEN format: {e}")
+            raise ValueError(f"Invalid FEN format: {e}")
+
+        return await self._analyze_board(
+            board,
+            depth,
+            evaluation,
+            fen,
+            include_tactics=include_tactics,
+            include_critical=include_critical,
+        )
+
+    async def _analyze_board(
+        self,
+        board: chess.Board,
+        depth: Optional[int] = None,
+        evaluation: Optional[Dict] = None,
+        fen: Optional[str] = None,
+        *,
+        include_tactics: bool = True,
+        include_critical: bool = True,
+        cache_key: Optional[Tuple] = None,
+    ) -> PositionAnalysis:
+        """
+        Analyze the position of a board, see analyze_position.
 
-            # Get basic stockfish evaluation at our standard depth
-            basic_eval = await stockfish_service.evaluate_position(fen, depth)
+        Callers that already hold a board pass it directly instead of its FEN,
+        so the position isn't parsed again. The board is not modified.
+
+        Args:
+            board: Board in the position to analyze
+            depth: Search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
+            evaluation: Optional engine evaluation of the position that was
+                        already computed; skips the engine call
+            fen: FEN of the board, if the caller already has it
+            include_tactics: Whether to look for tactical motifs in the best move
+            include_critical: Whether to identify critical squares
+            cache_key: Key of the position in the cache, if the caller already
+                       computed it with _position_cache_key
+
+        Returns:
+            PositionAnalysis: Detailed position analysis with square control
+            metrics. Analyses are cached and shared, so callers must not modify it
+        """
+        try:
+            fen = fen or board.fen()
+            search_depth = depth or stockfish_service.depth
+            logger.debug("Analyzing position: %s at depth %s", fen, search_depth)
 
-            # Create board from FEN
-            try:
-                board = chess.Board(fen)
-            except ValueError as e:
-                logger.error(f"Invalid FEN format: {e}")
-                raise ValueError(f"Invalid FEN format: {e}")
+            if cache_key is None:
+                cache_key = self._position_cache_key(
+                    board, depth, include_tactics, include_critical
+                )
+            cached = self._cached_position(cache_key, fen)
+            if cached is not None:
+                return cached
 
-            # Calculate square control with optimized method
-            square_control = tactics_service.calculate_square_control(board)
+            # Get basic stockfish evaluation at our standard depth
+            basic_eval = evaluation or await stockfish_service.evaluate_position(
+                fen, depth
+            )
+
+            # Calculate square control, shared with other analyses of the position
+            square_control = self._square_control(board, cache_key[0])
 
-            # Initialize position analysis
-            position_analysis = PositionAnalysis(
+            # Initialize position analysis; engine results and square control
+            # are produced in-process, so they are not validated again
+            position_analysis = PositionAnalysis.construct(
                 fen=basic_eval["fen"],
                 evaluation=basic_eval["evaluation"],
                 depth=basic_eval["depth"],
@@ -155,27 +341,29 @@ class AnalysisService:
             )
 
             # We exclusively focus on Stockfish's best move for tactical patterns
-            if basic_eval["best_move"]:
+            if include_tactics and basic_eval["best_move"]:
                 try:
-                    # Make a copy of the board
-                    future_board = board.copy()
-
-                    # Parse and execute the best move
+                    # Parse the best move and play it on a copy of the board;
+                    # tactics detection doesn't modify the boards it is given
                     best_move = chess.Move.from_uci(basic_eval["best_move"])
-
-                    # Create the board after the move
-                    board_before_move = board.copy()
+                    future_board = board.copy(stack=False)
                     future_board.push(best_move)
 
                     # Flag this as the best move (true by definition since it comes from Stockfish)
                     # This enforces our focus on only analyzing best moves for tactics
                     tactics = tactics_service.analyze_move_for_tactics(
-                        board_before_move, future_board, best_move, is_best_move=True
+                        board,
+                        future_board,
+                        best_move,
+                        is_best_move=True,
+                        control_before=square_control,
                     )
 
                     if tactics:
-                        logger.info(
-                            f"Tactical motifs found in best move {best_move.uci()}: {len(tactics)}"
+                        logger.debug(
+                            "Tactical motifs found in best move %s: %d",
+                            best_move,
+                            len(tactics),
                         )
 
                     position_analysis.tactical_motifs = tactics
@@ -183,30 +371,90 @@ class AnalysisService:
                     logger.error(f"Error analyzing tactics for best move: {e}")
                     position_analysis.tactical_motifs = []
 
-            # Identify critical squares (squares with big control imbalance)
-            critical_squares = []
-            for rank in range(8):
-                for file in range(8):
-                    white_control = square_control.white_control[rank][file]
-                    black_control = square_control.black_control[rank][file]
+            # Identify critical squares (squares with big control imbalance),
+            # comparing all 64 squares at once and visiting only the flagged ones
+            if include_critical:
+                control_difference = (
+                    square_control.white_control - square_control.black_control
+                )
+                critical_squares = []
+                for rank, file in np.argwhere(np.abs(control_difference) >= 2):
+                    difference = int(control_difference[rank, file])
+                    square_name = chess.SQUARE_NAMES[rank * 8 + file]
+                    if difference > 0:
+                        description = f"White control advantage (+{difference})"
+                    else:
+                        description = f"Black control advantage (+{-difference})"
 
-                    # Check for significant imbalance
-                    if abs(white_control - black_control) >= 2:
-                        square_name = chess.square_name(chess.square(file, rank))
-                        if white_control > black_control:
-                            description = f"White control advantage (+{white_control - black_control})"
-                        else:
-                            description = f"Black control advantage (+{black_control - white_control})"
+                    critical_squares.append((square_name, description))
 
-                        critical_squares.append((square_name, description))
+                position_analysis.critical_squares = critical_squares
 
-            position_analysis.critical_squares = critical_squares
+            self._position_cache[cache_key] = position_analysis
+            if len(self._position_cache) > self.MAX_CACHED_POSITIONS:
+                self._position_cache.popitem(last=False)
 
             return position_analysis
         except Exception as e:
             logger.error(f"Error in analyze_position: {e}")
             raise
 
+    @staticmethod
+    def _game_positions(
+        board: chess.Board, moves: List[chess.Move]
+    ) -> Tuple[List[Tuple[str, int]], List[chess.Board]]:
+        """
+        Walk the positions of a game for evaluation.
+
+        Args:
+            board: Board in the starting position of the game, which is not
+                   modified
+            moves: Mainline moves of the game
+
+        Returns:
+            Tuple: (FEN, signed Zobrist hash) pairs of every position, and a
+            board per position with the moves played so far, so the engine is
+            sent the game's moves rather than bare FENs
+        """
+        board = board.copy()
+        positions = [(board.fen(), position_hash(board))]
+        boards = [board.copy()]
+        for move in moves:
+            board.push(move)
+            positions.append((board.fen(), position_hash(board)))
+            boards.append(board.copy())
+        return positions, boards
+
+    async def _prefetch_evaluations(
+        self,
+        positions: List[Tuple[str, int]],
+        boards: List[chess.Board],
+        depth: Optional[int],
+        game_id: str,
+    ) -> Dict[str, Dict]:
+        """
+        Evaluate all positions of a game through the persistent position cache.
+
+        Args:
+            positions: Positions of the game from _game_positions
+            boards: Boards of the game from _game_positions
+            depth: Search depth (defaults to settings.STOCKFISH_DEPTH)
+            game_id: Game ID, used to keep engine search state within the game
+
+        Returns:
+            Dict[str, Dict]: Evaluations by FEN; empty if prefetching failed, in
+            which case positions are evaluated one by one
+        """
+        try:
+            results = await evaluate_positions_with_cache(
+                get_supabase_client(), positions, game_id, depth, boards
+            )
+        except Exception as e:
+            logger.warning(f"Prefetching evaluations for game {game_id} failed: {e}")
+            return {}
+
+        return {result["fen"]: result for result in results}
+
     async def analyze_game(
         self, pgn: str, depth: Optional[int] = None, game_id: Optional[str] = None
     ) -> GameAnalysisResult:
@@ -230,8 +478,12 @@ class AnalysisService:
             # Get game ID
             game_id = game_id or game.headers.get("Event", "Unnamed Game")
 
-            # Initialize board and annotations
+            # Walk the mainline once; the moves are reused by every pass below
             board = game.board()
+            moves = list(game.mainline_moves())
+            positions, boards = self._game_positions(board, moves)
+
+            # Initialize annotations
             annotations = []
             move_number = 1
 
@@ -246,116 +498,133 @@ class AnalysisService:
             # Critical positions tracking
             critical_positions = []
 
+            # Evaluate every position of the game up front in one batch, reusing
+            # evaluations persisted by earlier runs and other games. Annotations
+            # report the best move at BEST_MOVE_DEPTH, and a deeper evaluation
+            # answers a shallower request, so one batch at that depth serves
+            # both instead of searching every position twice
+            evaluations = await self._prefetch_evaluations(
+                positions,
+                boards,
+                max(depth or stockfish_service.depth, BEST_MOVE_DEPTH),
+                game_id,
+            )
+
+            position_after = None
+            initial_square_control = None
+
+            # Side to move, toggled after each move instead of asking the board
+            white_to_move = board.turn == chess.WHITE
+
             # Process each move in the game
-            for node in game.mainline():
-                move = node.move
+            for ply, move in enumerate(moves):
                 move_san = board.san(move)
                 move_uci = move.uci()
-                color = "white" if board.turn == chess.WHITE else "black"
+                color = "white" if white_to_move else "black"
+                # Factor turning an evaluation from the mover's perspective into
+                # white's, and back
+                mover_sign = 1 if white_to_move else -1
 
-                logger.info(f"Analyzing move {move_number} ({color}): {move_san}")
+                logger.debug("Analyzing move %d (%s): %s", move_number, color, move_san)
 
-                # Get position before the move
-                fen_before = board.fen()
+                # Get position before the move, serialized once by _game_positions
+                fen_before = positions[ply][0]
 
-                # Get enhanced position analysis before the move
-                try:
-                    position_before = await self.analyze_position(fen_before, depth)
-                    # Convert evaluation to white's perspective if it's black's turn
-                    if not board.turn:  # False means it's black's turn
-                        logger.info(
-                            f"Move {move_number} ({color}): Converting evaluation from {position_before.evaluation} to {-position_before.evaluation} (black to move)"
+                # The previous move's position after is this move's position before,
+                # so each position is only analyzed once
+                if position_after is not None:
+                    position_before = position_after
+                    evaluation_before = evaluation_after
+                else:
+                    # Get enhanced position analysis before the move
+                    try:
+                        # Only the first position of a game may be cached, so
+                        # check the cache before creating a coroutine
+                        cache_key = self._position_cache_key(
+                            board, depth, **_EVALUATION_ONLY
                         )
-                        evaluation_before = -position_before.evaluation
-                    else:
-                        logger.info(
-                            f"Move {move_number} ({color}): Keeping evaluation as {position_before.evaluation} (white to move)"
+                        position_before = self._cached_position(
+                            cache_key, fen_before
+                        ) or await self._analyze_board(
+                            board,
+                            depth,
+                            evaluations.get(fen_before),
+                            fen_before,
+                            cache_key=cache_key,
+                            **_EVALUATION_ONLY,
                         )
-                        evaluation_before = position_before.evaluation
-                    square_control_before = position_before.square_control
-                except Exception as e:
-                    logger.error(
-                        f"Error analyzing position before move {move_number} {color}: {e}"
-                    )
-                    # Use a default position analysis for error recovery
-                    default_board = chess.Board(fen_before)
-                    default_control = tactics_service.calculate_square_control(
-                        default_board
-                    )
-                    position_before = PositionAnalysis(
-                        fen=fen_before,
-                        evaluation=0.0,  # Neutral evaluation
-                        depth=0,
-                        is_mate=False,
-                        square_control=default_control,
-                    )
-                    evaluation_before = 0.0
-                    square_control_before = default_control
+                        # Convert evaluation to white's perspective; the mover
+                        # is to move before the move
+                        evaluation_before = mover_sign * position_before.evaluation
+                        initial_square_control = position_before.square_control
+                    except Exception as e:
+                        logger.error(
+                            f"Error analyzing position before move {move_number} {color}: {e}"
+                        )
+                        # Use a default position analysis for error recovery
+                        position_before = _fallback_position(
+                            fen_before, self._square_control(board)
+                        )
+                        evaluation_before = 0.0
+                        initial_square_control = position_before.square_control
 
-                # Create copies of the board for before and after
-                board_copy_before = chess.Board(fen_before)
+                # Keep the position before the move for tactics detection; the
+                # game's board itself is the position after it
+                board_copy_before = board.copy(stack=False)
 
                 # Make the move
                 board.push(move)
+                white_to_move = not white_to_move
 
                 # Get position after the move
-                fen_after = board.fen()
-                board_copy_after = chess.Board(fen_after)
+                fen_after = positions[ply + 1][0]
 
                 # Get enhanced position analysis after the move
                 try:
-                    position_after = await self.analyze_position(fen_after, depth)
-                    # Convert evaluation to white's perspective if it's black's turn
-                    if not board_copy_after.turn:  # False means it's black's turn
-                        logger.info(
-                            f"Move {move_number} ({color}) after: Converting evaluation from {position_after.evaluation} to {-position_after.evaluation} (black to move)"
-                        )
-                        evaluation_after = -position_after.evaluation
-                    else:
-                        logger.info(
-                            f"Move {move_number} ({color}) after: Keeping evaluation as {position_after.evaluation} (white to move)"
-                        )
-                        evaluation_after = position_after.evaluation
+                    # Repeated positions and transpositions are answered from
+                    # the cache without creating a coroutine
+                    cache_key = self._position_cache_key(
+                        board, depth, **_EVALUATION_ONLY
+                    )
+                    position_after = self._cached_position(
+                        cache_key, fen_after
+                    ) or await self._analyze_board(
+                        board,
+                        depth,
+                        evaluations.get(fen_after),
+                        fen_after,
+                        cache_key=cache_key,
+                        **_EVALUATION_ONLY,
+                    )
+                    # Convert evaluation to white's perspective; the opponent
+                    # is to move after the move
+                    evaluation_after = -mover_sign * position_after.evaluation
                     square_control_after = position_after.square_control
                 except Exception as e:
                     logger.error(
                         f"Error analyzing position after move {move_number} {color}: {e}"
                     )
                     # Use a default position analysis for error recovery
-                    default_board = chess.Board(fen_after)
-                    default_control = tactics_service.calculate_square_control(
-                        default_board
-                    )
-                    position_after = PositionAnalysis(
-                        fen=fen_after,
-                        evaluation=0.0,  # Neutral evaluation
-                        depth=0,
-                        is_mate=False,
-                        square_control=default_control,
+                    position_after = _fallback_position(
+                        fen_after, self._square_control(board)
                     )
                     evaluation_after = 0.0
-                    square_control_after = default_control
+                    square_control_after = position_after.square_control
 
-                # Calculate evaluation change (always from white's perspective for storage)
+                # Calculate evaluation change (always from white's perspective for
+                # storage), and classify it from the perspective of the mover
                 evaluation_change = evaluation_after - evaluation_before
-                logger.info(
-                    f"Move {move_number} ({color}): Evaluation change from {evaluation_before} to {evaluation_after} = {evaluation_change} (white's perspective)"
+                classification_change = mover_sign * evaluation_change
+                logger.debug(
+                    "Move %s (%s): evaluation %s -> %s (white's perspective), "
+                    "classification change %s",
+                    move_number,
+                    color,
+                    evaluation_before,
+                    evaluation_after,
+                    classification_change,
                 )
 
-                # For classification, adjust based on whose move it was
-                if color == "black":
-                    classification_change = (
-                        -evaluation_change
-                    )  # Negate for black's perspective
-                    logger.info(
-                        f"Move {move_number} ({color}): Classification change = {classification_change} (black's perspective)"
-                    )
-                else:
-                    classification_change = evaluation_change
-                    logger.info(
-                        f"Move {move_number} ({color}): Classification change = {classification_change} (white's perspective)"
-                    )
-
                 # Classify the move
                 classification = classify_move(classification_change)
 
@@ -369,13 +638,29 @@ class AnalysisService:
                 # Get the best move at depth 20
                 best_move_depth20 = None
                 try:
-                    # Calculate best move at depth 20 for the position before the move
-                    best_move_result = await stockfish_service.get_best_move_at_depth(
-                        fen_before, 20
-                    )
-                    best_move_depth20 = best_move_result["best_move"]
-                    logger.info(
-                        f"Move {move_number} ({color}): Best move at depth 20 is {best_move_depth20}"
+                    # Use the best move at depth 20 for the position before the
+                    # move from its own or the prefetched evaluation, and only
+                    # search it now if prefetching failed
+                    best_move_evaluation = evaluations.get(fen_before)
+                    if (
+                        position_before.depth >= BEST_MOVE_DEPTH
+                        and position_before.best_move
+                    ):
+                        best_move_depth20 = position_before.best_move
+                    elif best_move_evaluation is not None:
+                        best_move_depth20 = best_move_evaluation["best_move"]
+                    else:
+                        best_move_result = (
+                            await stockfish_service.get_best_move_at_depth(
+                                fen_before, BEST_MOVE_DEPTH
+                            )
+                        )
+                        best_move_depth20 = best_move_result["best_move"]
+                    logger.debug(
+                        "Move %d (%s): Best move at depth 20 is %s",
+                        move_number,
+                        color,
+                        best_move_depth20,
                     )
                 except Exception as e:
                     logger.error(
@@ -385,18 +670,25 @@ class AnalysisService:
                 # Detect tactical motifs for this move
                 try:
                     # Only analyze best moves as determined by Stockfish
+                    # The square control of both positions is already known
                     tactical_motifs = tactics_service.analyze_move_for_tactics(
                         board_copy_before,
-                        board_copy_after,
+                        board,
                         move,
                         is_best_move=(is_best_move),
+                        control_before=position_before.square_control,
+                        control_after=square_control_after,
                     )
 
                     # Log all detected motifs for debugging
-                    if tactical_motifs:
-                        tactic_types = [t.motif_type for t in tactical_motifs]
-                        logger.info(
-                            f"Move {move_number} ({color}): Detected {len(tactical_motifs)} tactical motifs: {tactic_types}"
+                    if tactical_motifs and logger.isEnabledFor(logging.DEBUG):
+                        tactic_types = [t.motif_type.label for t in tactical_motifs]
+                        logger.debug(
+                            "Move %d (%s): Detected %d tactical motifs: %s",
+                            move_number,
+                            color,
+                            len(tactical_motifs),
+                            tactic_types,
                         )
                 except Exception as e:
                     logger.error(
@@ -407,8 +699,9 @@ class AnalysisService:
                     )
                     tactical_motifs = []
 
-                # Create move annotation
-                move_analysis = MoveAnalysis(
+                # Create move annotation from values computed above, skipping
+                # validation
+                move_analysis = MoveAnalysis.construct(
                     move_uci=move_uci,
                     move_san=move_san,
                     move_number=move_number,
@@ -416,20 +709,18 @@ class AnalysisService:
                     fen_after=fen_after,
                     evaluation_before=evaluation_before,
                     evaluation_after=evaluation_after,
-                    evaluation_change=evaluation_change,
                     classification=classification,
                     is_best_move=is_best_move,
                     is_book_move=False,  # Not implementing book detection yet
                     best_move=best_move_depth20,  # Best move calculated at depth 20
                     tactical_motifs=tactical_motifs,
-                    square_control_before=square_control_before,
                     square_control_after=square_control_after,
                 )
 
                 # Track player weaknesses
                 if classification in ["mistake", "blunder"]:
                     # Determine the phase of the game
-                    piece_count = len(board.piece_map())
+                    piece_count = chess.popcount(board.occupied)
 
                     if move_number <= 10:
                         # Opening phase
@@ -461,9 +752,18 @@ class AnalysisService:
                 game_id=game_id,
                 total_moves=len(annotations),
                 annotations=annotations,
+                initial_square_control=initial_square_control,
                 player_weaknesses=player_weaknesses,
                 critical_positions=critical_positions,
             )
+            logger.info(
+                "Analyzed game %s: %d moves, %d blunders",
+                game_id,
+                len(annotations),
+                sum(
+                    annotation.classification == "blunder" for annotation in annotations
+                ),
+            )
 
             return game_analysis
         except Exception as e:
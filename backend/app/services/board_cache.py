@@ -0,0 +1,43 @@
+import threading
+from collections import OrderedDict
+
+import chess
+
+# Maximum number of parsed positions kept in memory
+MAX_CACHED_BOARDS = 1024
+
+_board_cache: "OrderedDict[str, chess.Board]" = OrderedDict()
+# Sync endpoints run in FastAPI's threadpool, so the cache is shared across threads
+_board_cache_lock = threading.Lock()
+
+
+def board_from_fen(fen: str) -> chess.Board:
+    """
+    Get a board for a FEN, reusing the parse of recently seen positions.
+
+    Parsed boards are kept in a small LRU cache and callers always receive
+    their own copy, so the returned board may be freely modified.
+
+    Args:
+        fen: FEN notation of the position
+
+    Returns:
+        chess.Board: A new board in the given position
+
+    Raises:
+        ValueError: If the FEN is invalid
+    """
+    with _board_cache_lock:
+        board = _board_cache.get(fen)
+        if board is not None:
+            _board_cache.move_to_end(fen)
+            return board.copy(stack=False)
+
+    # Parse outside the lock; a concurrent parse of the same FEN is harmless
+    board = chess.Board(fen)
+    with _board_cache_lock:
+        _board_cache[fen] = board
+        if len(_board_cache) > MAX_CACHED_BOARDS:
+            _board_cache.popitem(last=False)
+
+    return board.copy(stack=False)
@@ -0,0 +1,180 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import chess
+import chess.polyglot
+
+from app.core.config import settings
+from app.db.supabase import execute_query
+from app.services.stockfish import stockfish_service
+
+logger = logging.getLogger(__name__)
+
+
+def position_hash(board: chess.Board) -> int:
+    """
+    Get the Zobrist hash of a position as a signed 64-bit integer.
+
+    Postgres has no unsigned 64-bit type, so the hash is reinterpreted
+    to fit a BIGINT column.
+
+    Args:
+        board: Board in the position to hash
+
+    Returns:
+        int: Signed Zobrist hash of the position
+    """
+    zobrist = chess.polyglot.zobrist_hash(board)
+    return zobrist - (1 << 64) if zobrist >= (1 << 63) else zobrist
+
+
+async def evaluate_positions_with_cache(
+    supabase,
+    positions: List[Tuple[str, int]],
+    game_id: Optional[str] = None,
+    depth: Optional[int] = None,
+    boards: Optional[List[chess.Board]] = None,
+) -> List[Dict]:
+    """
+    Evaluate a batch of positions, consulting the persistent position cache first.
+
+    Evaluations are keyed by Zobrist hash in the position_eval_cache table so
+    positions shared between games (openings in particular) are only sent to
+    the engine once. All cache misses are evaluated concurrently in one batch.
+    Cache failures fall back to plain engine evaluations.
+
+    Args:
+        supabase: Supabase client
+        positions: (FEN, signed Zobrist hash) pairs of the positions to evaluate
+        game_id: Optional ID of the game the positions belong to, so the engine
+                 keeps its search state between positions of the same game
+        depth: Search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
+        boards: Optional boards in the same order as positions, with the moves
+                that led to each position on their move stack. The engine is
+                then sent the game's moves instead of bare FENs
+
+    Returns:
+        List[Dict]: Evaluation details in the same format as evaluate_position,
+        in the same order as positions
+    """
+    depth = depth or stockfish_service.depth
+    hashes = list({zobrist for _, zobrist in positions})
+    evaluations: Dict[int, Dict] = {}
+
+    try:
+        cached = await execute_query(
+            supabase.table("position_eval_cache")
+            .select("zobrist, evaluation, depth, best_move, is_mate, mate_in")
+            .in_("zobrist", hashes)
+            .gte("depth", depth)
+        )
+        for row in cached.data:
+            evaluations[row.pop("zobrist")] = row
+    except Exception as e:
+        logger.warning(f"Position cache lookup failed: {str(e)}")
+
+    # Evaluate each missing position once, even if it occurs several times
+    missing: Dict[int, int] = {}
+    for index, (_, zobrist) in enumerate(positions):
+        if zobrist not in evaluations:
+            missing.setdefault(zobrist, index)
+
+    if missing:
+        indexes = list(missing.values())
+        results = await stockfish_service.evaluate_positions_batch(
+            [positions[index][0] for index in indexes],
+            depth,
+            game=game_id,
+            boards=[boards[index] for index in indexes] if boards else None,
+        )
+        rows = []
+        for zobrist, result in zip(missing, results):
+            evaluations[zobrist] = result
+            rows.append(
+                {
+                    "zobrist": zobrist,
+                    "depth": result["depth"],
+                    "evaluation": result["evaluation"],
+                    "best_move": result["best_move"],
+                    "is_mate": result["is_mate"],
+                    "mate_in": result["mate_in"],
+                }
+            )
+
+        try:
+            await execute_query(
+                supabase.table("position_eval_cache").upsert(
+                    rows, ignore_duplicates=True
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Failed to store positions in cache: {str(e)}")
+
+    return [{**evaluations[zobrist], "fen": fen} for fen, zobrist in positions]
+
+
+def _white_evaluation(result: Dict) -> float:
+    """Get an evaluation from white's perspective using the side to move of its FEN."""
+    white_to_move = result["fen"].split(" ")[1] == "w"
+    return result["evaluation"] if white_to_move else -result["evaluation"]
+
+
+async def evaluate_line_with_cache(
+    supabase,
+    positions: List[Tuple[str, int]],
+    game_id: Optional[str] = None,
+    depth: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Evaluate the consecutive positions of a game, searching quiet ones shallowly.
+
+    Every position is first evaluated at settings.STOCKFISH_QUICK_DEPTH. Only
+    positions next to a swing of at least settings.QUIET_SWING_THRESHOLD are
+    searched again at full depth, since smaller swings never make a move an
+    inaccuracy or worse. This repeats until no swing involves a quick
+    evaluation. Every pass goes through the persistent position cache, which
+    records the depth of every evaluation.
+
+    Args:
+        supabase: Supabase client
+        positions: (FEN, signed Zobrist hash) pairs in game order
+        game_id: Optional ID of the game the positions belong to
+        depth: Full search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
+
+    Returns:
+        List[Dict]: Evaluation details in the same format as evaluate_position,
+        in the same order as positions
+    """
+    depth = depth or stockfish_service.depth
+    quick_depth = min(settings.STOCKFISH_QUICK_DEPTH, depth)
+    evaluations = await evaluate_positions_with_cache(
+        supabase, positions, game_id, quick_depth
+    )
+
+    # A swing is only trustworthy at full depth, so deepen both of its ends.
+    # A deepened position is then compared again with its shallow neighbours,
+    # so repeat until every swing is between two full depth evaluations
+    deepened = set()
+    while True:
+        swings = set()
+        for i in range(1, len(evaluations)):
+            before = _white_evaluation(evaluations[i - 1])
+            after = _white_evaluation(evaluations[i])
+            if abs(after - before) >= settings.QUIET_SWING_THRESHOLD:
+                swings.update((i - 1, i))
+
+        deepen = sorted(i for i in swings - deepened if evaluations[i]["depth"] < depth)
+        if not deepen:
+            break
+
+        deep = await evaluate_positions_with_cache(
+            supabase, [positions[i] for i in deepen], game_id, depth
+        )
+        for i, result in zip(deepen, deep):
+            evaluations[i] = result
+        deepened.update(deepen)
+
+    logger.debug(
+        f"Evaluated {len(positions)} positions, {len(deepened)} of them at depth {depth}"
+    )
+    return evaluations
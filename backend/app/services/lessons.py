@@ -4,9 +4,11 @@ import chess.pgn
 import logging
 from typing import Dict, List, Optional, Tuple, Any
 
-from app.db.supabase import get_supabase_client
+from app.core.config import settings
+from app.db.supabase import execute_query, get_supabase_client
 from app.services.stockfish import stockfish_service
 from app.services.tactics import tactics_service
+from app.services.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,24 +30,34 @@ class LessonService:
             "trapped_piece": "A trapped piece is one that has limited or no available moves and is at risk of capture.",
             "zwischenzug": "A zwischenzug (German for 'in-between move') is an intermediate move that changes the situation to a player's advantage.",
         }
+        # Recently read lesson lists by (player_id, list kind, limit)
+        self._lesson_cache = TTLCache(settings.LESSON_CACHE_TTL)
+
+    def invalidate_player_lessons(self, player_id: str) -> None:
+        """Forget the cached lesson lists of a player after their lessons changed."""
+        self._lesson_cache.discard_where(lambda key: key[0] == player_id)
 
     async def get_player_lessons(self, player_id: str, limit: int = 20) -> List[Dict]:
         """Retrieve existing lessons for a player."""
+        cached = self._lesson_cache.get((player_id, "all", limit))
+        if cached is not None:
+            return cached
+
         supabase = get_supabase_client()
-        response = (
+        response = await execute_query(
             supabase.table("player_lessons")
             .select("*")
             .eq("player_id", player_id)
             .order("created_at", desc=True)
             .limit(limit)
-            .execute()
         )
+        self._lesson_cache.set((player_id, "all", limit), response.data)
         return response.data
 
     async def get_player_games(self, player_id: str, limit: int = 10) -> List[Dict]:
         """Retrieve recent games for a player."""
         supabase = get_supabase_client()
-        response = (
+        response = await execute_query(
             supabase.table("games")
             .select("*")
             .eq("user_id", player_id)
@@ -54,7 +66,6 @@ class LessonService:
             )  # Only analyze games that have enhanced analysis
             .order("created_at", desc=True)
             .limit(limit)
-            .execute()
         )
         return response.data
 
@@ -63,7 +74,9 @@ class LessonService:
         supabase = get_supabase_client()
 
         # First get the game to determine player color
-        game_response = supabase.table("games").select("*").eq("id", game_id).execute()
+        game_response = await execute_query(
+            supabase.table("games").select("*").eq("id", game_id)
+        )
 
         if not game_response.data:
             logger.warning(f"Game {game_id} not found")
@@ -77,12 +90,11 @@ class LessonService:
             return []
 
         # Get enhanced annotations to find blunders
-        annotation_response = (
+        annotation_response = await execute_query(
             supabase.table("enhanced_move_annotations")
             .select("*")
             .eq("game_id", game_id)
             .order("move_number")
-            .execute()
         )
 
         if not annotation_response.data:
@@ -149,7 +161,7 @@ class LessonService:
         primary_tactic = None
         if blunder_data.get("tactical_motifs"):
             for motif in blunder_data["tactical_motifs"]:
-                primary_tactic = motif.motif_type
+                primary_tactic = motif.motif_type.label
                 break
 
         # Generate title
@@ -209,43 +221,58 @@ class LessonService:
 
         return lesson
 
-    async def store_lesson(self, player_id: str, lesson_data: Dict) -> Dict:
-        """Store a generated lesson in the database."""
+    async def store_lessons(self, player_id: str, lessons: List[Dict]) -> List[Dict]:
+        """Store generated lessons in the database with a single insert."""
+        if not lessons:
+            return []
+
         supabase = get_supabase_client()
 
-        # Check if a similar lesson already exists
-        existing_response = (
+        # Check which of these lessons already exist
+        game_ids = list({lesson["associated_game_id"] for lesson in lessons})
+        existing_response = await execute_query(
             supabase.table("player_lessons")
-            .select("id")
+            .select("position_fen, associated_game_id")
             .eq("player_id", player_id)
-            .eq("position_fen", lesson_data["position_fen"])
-            .eq("associated_game_id", lesson_data["associated_game_id"])
-            .execute()
+            .in_("associated_game_id", game_ids)
         )
+        stored = {
+            (row["position_fen"], row["associated_game_id"])
+            for row in existing_response.data
+        }
 
-        # Don't create duplicates
-        if existing_response.data:
-            logger.info(
-                f"Lesson for position {lesson_data['position_fen']} from game {lesson_data['associated_game_id']} already exists"
+        # Don't create duplicates, neither of stored lessons nor within the batch
+        lesson_records = []
+        for lesson_data in lessons:
+            key = (lesson_data["position_fen"], lesson_data["associated_game_id"])
+            if key in stored:
+                logger.info(
+                    f"Lesson for position {lesson_data['position_fen']} from game {lesson_data['associated_game_id']} already exists"
+                )
+                continue
+            stored.add(key)
+
+            lesson_records.append(
+                {
+                    "player_id": player_id,
+                    "lesson_type": lesson_data["type"],
+                    "title": lesson_data["title"],
+                    "content": lesson_data["content"],
+                    "position_fen": lesson_data["position_fen"],
+                    "exercises": lesson_data["exercises"],
+                    "associated_game_id": lesson_data["associated_game_id"],
+                    "move_number": lesson_data["move_number"],
+                }
             )
-            return existing_response.data[0]
-
-        lesson_record = {
-            "player_id": player_id,
-            "lesson_type": lesson_data["type"],
-            "title": lesson_data["title"],
-            "content": lesson_data["content"],
-            "position_fen": lesson_data["position_fen"],
-            "exercises": lesson_data["exercises"],
-            "associated_game_id": lesson_data["associated_game_id"],
-            "move_number": lesson_data["move_number"],
-        }
 
-        response = supabase.table("player_lessons").insert(lesson_record).execute()
+        if not lesson_records:
+            return []
 
-        if response.data:
-            return response.data[0]
-        return None
+        response = await execute_query(
+            supabase.table("player_lessons").insert(lesson_records)
+        )
+        self.invalidate_player_lessons(player_id)
+        return response.data or []
 
     async def complete_lesson(
         self, lesson_id: str, score: Optional[int] = None
@@ -257,32 +284,37 @@ class LessonService:
         if score is not None:
             update_data["score"] = score
 
-        response = (
-            supabase.table("player_lessons")
-            .update(update_data)
-            .eq("id", lesson_id)
-            .execute()
+        response = await execute_query(
+            supabase.table("player_lessons").update(update_data).eq("id", lesson_id)
         )
 
+        # The completed lesson drops out of its player's recommendations
+        for row in response.data:
+            self.invalidate_player_lessons(row["player_id"])
+
         return len(response.data) > 0
 
     async def get_recommended_lessons(
         self, player_id: str, limit: int = 3
     ) -> List[Dict]:
         """Get personalized lesson recommendations for a player."""
+        cached = self._lesson_cache.get((player_id, "recommended", limit))
+        if cached is not None:
+            return cached
+
         supabase = get_supabase_client()
 
         # First get incomplete lessons
-        response = (
+        response = await execute_query(
             supabase.table("player_lessons")
             .select("*")
             .eq("player_id", player_id)
             .eq("completed", False)
             .order("created_at", desc=True)
             .limit(limit)
-            .execute()
         )
 
+        self._lesson_cache.set((player_id, "recommended", limit), response.data)
         return response.data
 
 
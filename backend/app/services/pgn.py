@@ -0,0 +1,88 @@
+import re
+from typing import List, Tuple
+
+import chess
+
+# PGN tag pair, e.g. [FEN "8/8/8/8/8/8/8/8 w - - 0 1"]
+_HEADER_RE = re.compile(r'^\s*\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$', re.MULTILINE)
+
+# SAN token: piece moves, pawn moves, promotions and castling with optional check suffix
+_SAN_RE = re.compile(
+    r"(?:[KQRBN]?[a-h]?[1-8]?x?[a-h][1-8](?:=?[QRBN])?|O-O(?:-O)?|0-0(?:-0)?)[+#]?"
+)
+
+
+def _strip_movetext(movetext: str) -> str:
+    """
+    Remove comments and variations from PGN movetext, keeping only the mainline.
+
+    Args:
+        movetext: PGN movetext without tag pairs
+
+    Returns:
+        str: Mainline movetext with comments and (nested) variations removed
+    """
+    mainline = []
+    variation_depth = 0
+    in_comment = False
+    in_line_comment = False
+
+    for char in movetext:
+        if in_comment:
+            in_comment = char != "}"
+            continue
+        if in_line_comment:
+            in_line_comment = char != "\n"
+            continue
+
+        if char == "{":
+            in_comment = True
+        elif char == ";":
+            in_line_comment = True
+        elif char == "(":
+            variation_depth += 1
+        elif char == ")":
+            variation_depth = max(0, variation_depth - 1)
+        elif variation_depth == 0:
+            mainline.append(char)
+            continue
+
+        # Keep tokens on either side of a removed span separated
+        mainline.append(" ")
+
+    return "".join(mainline)
+
+
+def parse_mainline(pgn: str) -> Tuple[chess.Board, List[chess.Move]]:
+    """
+    Parse the mainline moves of a PGN without building a game tree.
+
+    Only what annotation needs is extracted: the starting position (honouring
+    the FEN tag) and the mainline moves. Headers, comments, NAGs and
+    variations are skipped.
+
+    Args:
+        pgn: PGN text of a single game
+
+    Returns:
+        Tuple of (board at the starting position, list of mainline moves)
+
+    Raises:
+        ValueError: If the starting FEN or any mainline move is invalid
+    """
+    headers = dict(_HEADER_RE.findall(pgn))
+    movetext = _HEADER_RE.sub("", pgn)
+
+    chess960 = "960" in headers.get("Variant", "")
+    fen = headers.get("FEN", chess.STARTING_FEN)
+    board = chess.Board(fen, chess960=chess960)
+
+    # Parse on a scratch board so the caller gets the untouched starting position
+    scratch = board.copy(stack=False)
+    moves = []
+    for token in _SAN_RE.finditer(_strip_movetext(movetext)):
+        move = scratch.parse_san(token.group(0))
+        scratch.push(move)
+        moves.append(move)
+
+    return board, moves
@@ -1,14 +1,19 @@
 import asyncio
 import concurrent.futures
+import io
 import logging
 import os
 from typing import Dict, List, Optional, Tuple, Union
 
 import chess
 import chess.engine
+import chess.pgn
+import chess.polyglot
 from pydantic import BaseModel
 
 from app.core.config import settings
+from app.services.board_cache import board_from_fen
+from app.services.transposition_table import TranspositionTable
 
 logger = logging.getLogger(__name__)
 
@@ -21,20 +26,38 @@ class StockfishService:
         self.engine_path = settings.STOCKFISH_PATH
         self.depth = settings.STOCKFISH_DEPTH  # Standard depth 20 from config
         self.threads = settings.STOCKFISH_THREADS
+        self.hash_mb = settings.STOCKFISH_HASH_MB
         self._engine = None
+        # A command sent to an engine stops the search it is running, so the
+        # main engine is used by one caller at a time, and created only once.
+        # Like the pool locks, these are created in the running event loop
+        self._engine_lock: Optional[asyncio.Lock] = None
+        self._engine_init_lock: Optional[asyncio.Lock] = None
         self._engine_pool = []
-        self._max_engines = 6  # Maximum number of engine instances to create
+        # Maximum number of engine instances to create
+        self._max_engines = max(1, settings.STOCKFISH_POOL_SIZE)
         self._engine_locks = []  # Locks to control access to each engine
 
         # Position evaluation cache
-        self._position_cache = {}  # Format: {fen_depth: evaluation_dict}
+        # Position evaluation cache, keyed by Zobrist hash
+        self._position_cache = TranspositionTable(settings.STOCKFISH_EVAL_CACHE_SIZE)
         self._cache_hits = 0
         self._cache_misses = 0
-        self._max_cache_size = 10000  # Maximum number of positions to cache
 
     async def _get_engine(self) -> chess.engine.SimpleEngine:
         """Get or create a Stockfish engine instance."""
-        if self._engine is None:
+        if self._engine is not None:
+            return self._engine
+
+        if self._engine_init_lock is None:
+            self._engine_init_lock = asyncio.Lock()
+            self._engine_lock = asyncio.Lock()
+
+        async with self._engine_init_lock:
+            # Another caller may have created the engine while this one waited
+            if self._engine is not None:
+                return self._engine
+
             try:
                 # Check if the engine path exists
                 if not os.path.exists(self.engine_path):
@@ -46,11 +69,12 @@ class StockfishService:
 
                 logger.info(f"Initializing Stockfish engine from {self.engine_path}")
                 transport, engine = await chess.engine.popen_uci(self.engine_path)
-                self._engine = engine
 
                 try:
-                    # Configure number of threads
-                    await self._engine.configure({"Threads": self.threads})
+                    # Configure number of threads and transposition table size
+                    await engine.configure(
+                        {"Threads": self.threads, "Hash": self.hash_mb}
+                    )
                     logger.info(f"Engine configured with {self.threads} threads")
 
                     # Verify engine is working with a simple command
@@ -64,6 +88,9 @@ class StockfishService:
                         f"Engine initialized but configuration failed: {config_err}"
                     )
                     # Continue anyway since the engine is working
+
+                # Only hand out the engine once it is configured
+                self._engine = engine
             except Exception as e:
                 logger.error(f"Failed to initialize Stockfish engine: {e}")
                 raise RuntimeError(f"Failed to initialize Stockfish engine: {e}")
@@ -96,14 +123,15 @@ class StockfishService:
                         logger.error(error_msg)
                         raise FileNotFoundError(error_msg)
 
-                    # Calculate threads per engine - at least 1 thread
-                    threads_per_engine = max(1, self.threads // self._max_engines)
+                    # Pool engines search single-threaded so results are reproducible;
+                    # parallelism comes from running several engines side by side
+                    hash_per_engine = max(16, self.hash_mb // self._max_engines)
                     logger.info(
-                        f"Creating engine instance {len(self._engine_pool)+1} with {threads_per_engine} threads"
+                        f"Creating engine instance {len(self._engine_pool)+1} with {hash_per_engine} MB hash"
                     )
 
                     transport, engine = await chess.engine.popen_uci(self.engine_path)
-                    await engine.configure({"Threads": threads_per_engine})
+                    await engine.configure({"Threads": 1, "Hash": hash_per_engine})
 
                     # Store engine and its lock
                     self._engine_pool.append(engine)
@@ -135,10 +163,7 @@ class StockfishService:
                 await self._get_engine()
 
             if self._engine:
-                # Create a lock if needed
-                if len(self._engine_locks) == 0:
-                    self._engine_locks.append(asyncio.Lock())
-                return self._engine, self._engine_locks[0]
+                return self._engine, self._engine_lock
             raise
 
     async def close(self):
@@ -168,17 +193,18 @@ class StockfishService:
             Dict containing the best move and evaluation
         """
         engine = await self._get_engine()
-        board = chess.Board(fen)
+        board = board_from_fen(fen)
 
-        # Adjust engine strength based on skill level
-        await engine.configure({"Skill Level": skill_level})
+        async with self._engine_lock:
+            # Adjust engine strength based on skill level
+            await engine.configure({"Skill Level": skill_level})
 
-        # Calculate the best move
-        limit = chess.engine.Limit(time=move_time)
-        result = await engine.play(board, limit)
+            # Calculate the best move
+            limit = chess.engine.Limit(time=move_time)
+            result = await engine.play(board, limit)
 
-        # Get evaluation
-        analysis = await engine.analyse(board, limit)
+            # Get evaluation
+            analysis = await engine.analyse(board, limit)
         score = analysis["score"].relative.score(mate_score=10000)
 
         return {
@@ -189,7 +215,13 @@ class StockfishService:
         }
 
     async def evaluate_position(
-        self, fen: str, depth: Optional[int] = None, engine_index: int = 0
+        self,
+        fen: str,
+        depth: Optional[int] = None,
+        engine_index: int = 0,
+        game: Optional[str] = None,
+        board: Optional[chess.Board] = None,
+        skill_level: Optional[int] = None,
     ) -> Dict:
         """
         Evaluate a chess position with caching.
@@ -199,47 +231,61 @@ class StockfishService:
             depth: Search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
                    Note: A standard depth of 20 is used across all evaluations for consistency
             engine_index: Index of the engine to use from the pool
+            game: Optional identifier of the game the position belongs to. The
+                  engine only receives ucinewgame (clearing its transposition
+                  table) when this changes, so positions of one game reuse the
+                  search results of the previous ones
+            board: Optional board in the position, with the moves that led to
+                   it on its move stack. The engine then receives the starting
+                   position and those moves instead of a bare FEN, so it knows
+                   which positions already occurred in the game
+            skill_level: Optional Stockfish skill level (0-20) for this search
+                         only. The engine's own setting is restored afterwards,
+                         and the weakened result is not cached
 
         Returns:
             Dict with evaluation details
         """
         try:
-            # Normalize and clean up FEN
-            try:
-                board = chess.Board(fen)
-                # Use a standardized FEN for caching to avoid duplicates
-                normalized_fen = board.fen().split(" ")[
-                    0
-                ]  # Only use piece positions for cache key
-            except ValueError as e:
-                logger.error(f"Invalid FEN format: {fen}: {str(e)}")
-                raise ValueError(f"Invalid FEN format: {str(e)}")
+            if board is None:
+                try:
+                    board = board_from_fen(fen)
+                except ValueError as e:
+                    logger.error(f"Invalid FEN format: {fen}: {str(e)}")
+                    raise ValueError(f"Invalid FEN format: {str(e)}")
 
             # Set search depth - standardized to 20 by default in config
             search_depth = depth or self.depth
 
-            # Create cache key
-            cache_key = f"{normalized_fen}_{search_depth}"
+            # Key by Zobrist hash: covers side to move, castling and en passant
+            # rights but ignores the move counters, so transpositions share an entry
+            cache_key = chess.polyglot.zobrist_hash(board)
 
-            # Check cache first
-            if cache_key in self._position_cache:
+            # Check cache first; a shallower result can't answer a deeper request
+            cached = self._position_cache.probe(cache_key, search_depth)
+            if cached is not None:
                 self._cache_hits += 1
                 logger.debug(
-                    f"Cache hit for position {normalized_fen} at depth {search_depth} (hits: {self._cache_hits}, misses: {self._cache_misses})"
+                    f"Cache hit for position {fen} at depth {cached['depth']} (hits: {self._cache_hits}, misses: {self._cache_misses})"
                 )
-                return self._position_cache[cache_key]
+                return {**cached, "fen": fen}
 
             # Cache miss, need to analyze the position
             self._cache_misses += 1
+            options = {} if skill_level is None else {"Skill Level": skill_level}
 
             if engine_index == 0:
                 # Use main engine
                 engine = await self._get_engine()
 
-                # Analyze position
+                # Analyze position; the lock keeps concurrent callers from
+                # cutting the search short
                 try:
                     limit = chess.engine.Limit(depth=search_depth)
-                    analysis = await engine.analyse(board, limit)
+                    async with self._engine_lock:
+                        analysis = await engine.analyse(
+                            board, limit, game=game, options=options
+                        )
                     score = analysis["score"].relative.score(mate_score=10000)
 
                     # Get best move if available
@@ -258,7 +304,8 @@ class StockfishService:
                     }
 
                     # Store in cache
-                    self._cache_position(cache_key, result)
+                    if not options:
+                        self._position_cache.store(cache_key, result)
 
                     return result
                 except Exception as e:
@@ -277,7 +324,9 @@ class StockfishService:
                     # Analyze position
                     try:
                         limit = chess.engine.Limit(depth=search_depth)
-                        analysis = await engine.analyse(board, limit)
+                        analysis = await engine.analyse(
+                            board, limit, game=game, options=options
+                        )
                         score = analysis["score"].relative.score(mate_score=10000)
 
                         # Get best move if available
@@ -296,7 +345,8 @@ class StockfishService:
                         }
 
                         # Store in cache
-                        self._cache_position(cache_key, result)
+                        if not options:
+                            self._position_cache.store(cache_key, result)
 
                         return result
                     except Exception as e:
@@ -309,33 +359,145 @@ class StockfishService:
             logger.error(f"Unhandled exception in evaluate_position: {str(e)}")
             raise
 
-    def _cache_position(self, cache_key: str, result: Dict) -> None:
+    async def evaluate_positions_batch(
+        self,
+        fens: List[str],
+        depth: Optional[int] = None,
+        game: Optional[str] = None,
+        boards: Optional[List[chess.Board]] = None,
+    ) -> List[Dict]:
         """
-        Add a position evaluation to the cache with LRU management.
+        Evaluate several positions concurrently across the engine pool.
+
+        Each pool engine pulls the next pending position as soon as it is free,
+        so a slow position doesn't hold up the ones queued behind it and a whole
+        game is evaluated at once instead of one awaited call per position.
 
         Args:
-            cache_key: Key for the position (fen_depth)
-            result: Evaluation result to cache
+            fens: FEN notations of the positions to evaluate
+            depth: Search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
+            game: Optional identifier of the game the positions belong to
+            boards: Optional boards in the positions of fens, with the moves
+                    that led to them, see evaluate_position
+
+        Returns:
+            List of evaluation dicts in the same order as fens
         """
-        # Implement simple LRU - remove oldest item if we're at capacity
-        if len(self._position_cache) >= self._max_cache_size:
-            # Remove random item (simple approach)
-            # For a more sophisticated LRU, we would track access time
-            try:
-                # Get first key to remove
-                key_to_remove = next(iter(self._position_cache))
-                del self._position_cache[key_to_remove]
-                logger.debug(f"Cache full, removed entry {key_to_remove}")
-            except (StopIteration, KeyError):
-                # This should never happen, but just in case
-                logger.warning("Failed to remove item from cache")
-
-        # Add new item to cache
-        self._position_cache[cache_key] = result
-        logger.debug(
-            f"Added position to cache: {cache_key} (size: {len(self._position_cache)})"
+        if not fens:
+            return []
+
+        # Create the pool engines up front so concurrent calls don't race to create them
+        for i in range(min(self._max_engines, len(fens))):
+            await self._get_engine_from_pool(i)
+        pool_size = len(self._engine_pool) or 1
+
+        pending = iter(enumerate(fens))
+        results: List[Optional[Dict]] = [None] * len(fens)
+
+        async def worker(engine_index: int) -> None:
+            for i, fen in pending:
+                results[i] = await self.evaluate_position(
+                    fen,
+                    depth,
+                    engine_index=engine_index,
+                    game=game,
+                    board=boards[i] if boards else None,
+                )
+
+        await asyncio.gather(*(worker(i + 1) for i in range(pool_size)))
+        return results
+
+    async def _evaluate_each(
+        self,
+        fens: List[str],
+        depth: Optional[int] = None,
+        skill_level: Optional[int] = None,
+    ) -> List[Union[Dict, BaseException]]:
+        """
+        Evaluate positions concurrently across the engine pool, one by one.
+
+        Positions are handed to the pool engines in turn, and each engine's
+        lock lets it search one position at a time. Unlike
+        evaluate_positions_batch, a failing position doesn't fail the others.
+
+        Args:
+            fens: FEN notations of the positions to evaluate
+            depth: Search depth (defaults to settings.STOCKFISH_DEPTH which is 20)
+            skill_level: Optional skill level of these searches only, see
+                         evaluate_position
+
+        Returns:
+            List of evaluation dicts in the same order as fens, with the
+            exception raised for a position in place of its evaluation
+        """
+        if not fens:
+            return []
+
+        # Create the pool engines up front so concurrent calls don't race to create them
+        for i in range(min(self._max_engines, len(fens))):
+            await self._get_engine_from_pool(i)
+        pool_size = len(self._engine_pool) or 1
+
+        return await asyncio.gather(
+            *(
+                self.evaluate_position(
+                    fen,
+                    depth,
+                    engine_index=i % pool_size + 1,
+                    skill_level=skill_level,
+                )
+                for i, fen in enumerate(fens)
+            ),
+            return_exceptions=True,
         )
 
+    async def _evaluate_candidates(
+        self,
+        board: chess.Board,
+        moves: List[chess.Move],
+        depth: int,
+        target_eval: float,
+        skill_level: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Evaluate candidate moves concurrently by their distance from a target.
+
+        Args:
+            board: Board in the position the moves are played from
+            moves: Candidate moves
+            depth: Search depth of the positions after the moves
+            target_eval: Evaluation the moves should get close to
+            skill_level: Optional skill level of these searches only, see
+                         evaluate_position
+
+        Returns:
+            List of {"move", "eval", "diff"} dicts of the moves that could be
+            evaluated, in the order of moves
+        """
+        fens = []
+        for move in moves:
+            # Create temporary board with the move
+            temp_board = board.copy(stack=False)
+            temp_board.push(move)
+            fens.append(temp_board.fen())
+
+        candidates = []
+        results = await self._evaluate_each(fens, depth, skill_level)
+        for move, result in zip(moves, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error evaluating move {move.uci()}: {str(result)}")
+                # Skip this move and continue with others
+                continue
+
+            eval_val = -result["evaluation"]  # Negate for perspective flip
+
+            # Calculate distance from target
+            eval_diff = abs(eval_val - target_eval)
+
+            candidates.append({"move": move, "eval": eval_val, "diff": eval_diff})
+
+        return candidates
+
     async def get_best_move_at_depth(self, fen: str, depth: int = 20) -> Dict:
         """
         Get the best move for a position at a specific depth.
@@ -378,9 +540,7 @@ class StockfishService:
         Returns:
             Dict containing the selected move and related data
         """
-        # Use the main engine for initial evaluation and settings
-        engine = await self._get_engine()
-        board = chess.Board(fen)
+        board = board_from_fen(fen)
 
         if board.is_game_over():
             raise ValueError("Game is already over")
@@ -396,50 +556,13 @@ class StockfishService:
         # Calculate target evaluation
         target_eval = current_eval + eval_change
 
-        # Set skill level for all engines
-        await engine.configure({"Skill Level": skill_level})
-
-        # Ensure we have engine instances created
-        for i in range(min(self._max_engines, len(legal_moves))):
-            engine_from_pool, _ = await self._get_engine_from_pool(i)
-            await engine_from_pool.configure({"Skill Level": skill_level})
-
-        # Step 2: Phase 1 - Quick shallow evaluation of all moves to find candidates
+        # Step 2: Phase 1 - Quick shallow evaluation of all moves to find candidates.
+        # The pool engines are shared with game annotation, so the skill level
+        # is passed with each search instead of being configured on them
         shallow_depth = 8  # Even faster evaluation
-        candidates = []
-
-        # Process moves in batches based on available engines
-        for i in range(0, len(legal_moves), self._max_engines):
-            batch = legal_moves[i : i + self._max_engines]
-            tasks = []
-
-            # Create tasks for this batch
-            for j, move in enumerate(batch):
-                # Create temporary board with the move
-                temp_board = board.copy()
-                temp_board.push(move)
-
-                # Evaluate with engine from pool
-                task = self.evaluate_position(temp_board.fen(), shallow_depth, j + 1)
-                tasks.append((move, task))
-
-            # Process this batch
-            for move, task_obj in tasks:
-                try:
-                    # Wait for evaluation result
-                    result = await task_obj
-                    eval_val = -result["evaluation"]  # Negate for perspective flip
-
-                    # Calculate distance from target
-                    eval_diff = abs(eval_val - target_eval)
-
-                    candidates.append(
-                        {"move": move, "eval": eval_val, "diff": eval_diff}
-                    )
-                except Exception as e:
-                    logger.error(f"Error evaluating move {move.uci()}: {str(e)}")
-                    # Skip this move and continue with others
-                    continue
+        candidates = await self._evaluate_candidates(
+            board, legal_moves, shallow_depth, target_eval, skill_level
+        )
 
         # Sort candidates by their difference from target (smaller is better)
         candidates.sort(key=lambda x: x["diff"])
@@ -451,40 +574,13 @@ class StockfishService:
         )  # Evaluate at most 3 moves at full depth
         top_candidates = candidates[:num_top_candidates]
 
-        deep_results = []
-
-        # Process top candidates in batches too
-        for i in range(0, len(top_candidates), self._max_engines):
-            batch = top_candidates[i : i + self._max_engines]
-            tasks = []
-
-            # Create tasks for this batch
-            for j, candidate in enumerate(batch):
-                move = candidate["move"]
-                temp_board = board.copy()
-                temp_board.push(move)
-
-                # Evaluate with engine from pool
-                task = self.evaluate_position(temp_board.fen(), 12, j + 1)
-                tasks.append((move, task))
-
-            # Process this batch
-            for move, task_obj in tasks:
-                try:
-                    # Wait for evaluation result
-                    result = await task_obj
-                    eval_val = -result["evaluation"]  # Negate for perspective flip
-
-                    # Calculate distance from target
-                    eval_diff = abs(eval_val - target_eval)
-
-                    deep_results.append(
-                        {"move": move, "eval": eval_val, "diff": eval_diff}
-                    )
-                except Exception as e:
-                    logger.error(f"Error deep evaluating move {move.uci()}: {str(e)}")
-                    # Skip this move and continue with others
-                    continue
+        deep_results = await self._evaluate_candidates(
+            board,
+            [candidate["move"] for candidate in top_candidates],
+            12,
+            target_eval,
+            skill_level,
+        )
 
         # Find the best move from deep evaluation results
         if deep_results:
@@ -520,7 +616,7 @@ class StockfishService:
         """
         try:
             try:
-                game = chess.pgn.read_game(chess.io.StringIO(pgn))
+                game = chess.pgn.read_game(io.StringIO(pgn))
                 if not game:
                     raise ValueError("Invalid PGN format or empty game")
             except Exception as e:
@@ -528,44 +624,35 @@ class StockfishService:
                 raise ValueError(f"Invalid PGN format: {str(e)}")
 
             board = game.board()
+            moves = list(game.mainline_moves())
+            fens = [board.fen()]
+            for move in moves:
+                board.push(move)
+                fens.append(board.fen())
+
+            # Evaluate the position before every move concurrently
+            results = await self._evaluate_each(fens[:-1], depth)
+
             evaluations = []
             move_count = 0
-
-            for move in game.mainline_moves():
+            for move, eval_before in zip(moves, results):
                 move_count += 1
-                position_fen = board.fen()
-
-                try:
-                    # Use standardized depth for all analyses
-                    eval_before = await self.evaluate_position(position_fen, depth)
-
-                    # Execute the move
-                    board.push(move)
-
-                    evaluations.append(
-                        {
-                            "move": move.uci(),
-                            "move_number": move_count,
-                            "fen_before": position_fen,
-                            "fen_after": board.fen(),
-                            "evaluation": eval_before,
-                        }
-                    )
-                except Exception as e:
+                if isinstance(eval_before, Exception):
                     logger.error(
-                        f"Error analyzing move {move_count} ({move.uci()}): {str(e)}"
+                        f"Error analyzing move {move_count} ({move.uci()}): {str(eval_before)}"
                     )
                     # Continue with next move instead of failing the entire analysis
-                    board.push(move)
-                    evaluations.append(
-                        {
-                            "move": move.uci(),
-                            "move_number": move_count,
-                            "fen_before": position_fen,
-                            "fen_after": board.fen(),
-                            "evaluation": {"error": str(e)},
-                        }
-                    )
+                    eval_before = {"error": str(eval_before)}
+
+                evaluations.append(
+                    {
+                        "move": move.uci(),
+                        "move_number": move_count,
+                        "fen_before": fens[move_count - 1],
+                        "fen_after": fens[move_count],
+                        "evaluation": eval_before,
+                    }
+                )
 
             logger.info(f"Game analysis complete - analyzed {move_count} moves")
             return evaluations
@@ -585,7 +672,8 @@ class StockfishService:
             raise ValueError("Skill level must be between 0 and 20")
 
         engine = await self._get_engine()
-        await engine.configure({"Skill Level": skill_level})
+        async with self._engine_lock:
+            await engine.configure({"Skill Level": skill_level})
 
 
 # Create a single instance for reuse
@@ -3,8 +3,9 @@ from typing import Any, Dict, List, Optional, Tuple
 
 import chess
 import chess.pgn
+import numpy as np
 
-from app.models.analysis import SquareControl, TacticalMotif
+from app.models.analysis import MotifType, SquareControl, TacticalMotif
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -19,14 +20,17 @@ PIECE_VALUES = {
     chess.KING: 0,  # Not factored in material calculations
 }
 
+# Shifts that move each square's bit of a bitboard to the lowest bit
+_SQUARE_SHIFTS = np.arange(64, dtype=np.uint64)
+
 
 class TacticsService:
     """Service for detecting tactical patterns in chess positions."""
 
     def calculate_square_control(self, board: chess.Board) -> SquareControl:
         """
-        Calculate square control metrics for a given board position using python-chess's built-in
-        attackers() method for more accurate and efficient calculation.
+        Calculate square control metrics for a given board position from the
+        attack bitboards of its pieces.
 
         Args:
             board: Chess board position
@@ -35,64 +39,57 @@ class TacticsService:
             SquareControl object with metrics for each square
         """
         try:
-            # Initialize data structures
-            white_control = [[0 for _ in range(8)] for _ in range(8)]
-            black_control = [[0 for _ in range(8)] for _ in range(8)]
-            white_control_material = [[0 for _ in range(8)] for _ in range(8)]
-            black_control_material = [[0 for _ in range(8)] for _ in range(8)]
             white_legal_moves = {}
             black_legal_moves = {}
 
-            # Calculate control for each square on the board
-            for square in chess.SQUARES:
-                file_idx = chess.square_file(square)
-                rank_idx = chess.square_rank(square)
-
-                # Get white attackers for this square using built-in function
-                white_attackers = board.attackers(chess.WHITE, square)
-                for attacker in white_attackers:
-                    piece_type = board.piece_type_at(attacker)
-                    white_control[rank_idx][file_idx] += 1
-                    white_control_material[rank_idx][file_idx] += PIECE_VALUES.get(
-                        piece_type, 0
-                    )
-
-                # Get black attackers for this square using built-in function
-                black_attackers = board.attackers(chess.BLACK, square)
-                for attacker in black_attackers:
-                    piece_type = board.piece_type_at(attacker)
-                    black_control[rank_idx][file_idx] += 1
-                    black_control_material[rank_idx][file_idx] += PIECE_VALUES.get(
-                        piece_type, 0
-                    )
-
-            # Calculate legal moves for each piece using python-chess's move generation
-            for piece_square in chess.SQUARES:
-                piece = board.piece_at(piece_square)
-                if not piece:
-                    continue
-
-                # Get square name (e.g., "e4")
-                square_name = chess.square_name(piece_square)
+            # Expand the attack bitboard of every piece into a row of 64 bits,
+            # indexed by square (rank * 8 + file). A square's attackers are
+            # exactly the pieces whose attacks include it
+            piece_squares = list(chess.SquareSet(board.occupied))
+            pieces = [board.piece_at(square) for square in piece_squares]
+            attack_masks = np.array(
+                [board.attacks_mask(square) for square in piece_squares],
+                dtype=np.uint64,
+            )
+            attacked = ((attack_masks[:, np.newaxis] >> _SQUARE_SHIFTS) & 1).astype(
+                np.int8
+            )
+            is_white = np.array([piece.color for piece in pieces], dtype=bool)
+            values = np.array(
+                [PIECE_VALUES[piece.piece_type] for piece in pieces], dtype=np.int8
+            )
 
-                # Generate all legal moves for this piece
-                legal_moves = []
-                for move in board.legal_moves:
-                    if move.from_square == piece_square:
-                        legal_moves.append(chess.square_name(move.to_square))
+            # Calculate legal moves for each piece, generating the moves once
+            # and grouping their target squares (e.g. "e4") by origin square
+            legal_moves = {square: [] for square in piece_squares}
+            for move in board.legal_moves:
+                legal_moves[move.from_square].append(chess.SQUARE_NAMES[move.to_square])
 
-                # Store legal moves by color
+            # Store legal moves by color
+            for square, piece in zip(piece_squares, pieces):
                 if piece.color == chess.WHITE:
-                    white_legal_moves[square_name] = legal_moves
+                    white_legal_moves[chess.SQUARE_NAMES[square]] = legal_moves[square]
                 else:
-                    black_legal_moves[square_name] = legal_moves
-
-            # Create and return the SquareControl object
-            square_control = SquareControl(
-                white_control=white_control,
-                black_control=black_control,
-                white_control_material=white_control_material,
-                black_control_material=black_control_material,
+                    black_legal_moves[chess.SQUARE_NAMES[square]] = legal_moves[square]
+
+            # Count attackers and their material per square, stacked into one
+            # array reshaped to [grid][rank][file]
+            white_attacked = attacked[is_white]
+            black_attacked = attacked[~is_white]
+            control = np.array(
+                [
+                    white_attacked.sum(axis=0),
+                    black_attacked.sum(axis=0),
+                    values[is_white] @ white_attacked,
+                    values[~is_white] @ black_attacked,
+                ],
+                dtype=np.int8,
+            ).reshape(4, 8, 8)
+
+            # Create and return the SquareControl object; the values were built
+            # with the right types above, so skip validating them
+            square_control = SquareControl.construct(
+                control=control,
                 white_legal_moves=white_legal_moves,
                 black_legal_moves=black_legal_moves,
             )
@@ -102,17 +99,7 @@ class TacticsService:
         except Exception as e:
             logger.error(f"Error calculating square control: {e}")
             # Fallback to empty control metrics
-            empty_control = [[0 for _ in range(8)] for _ in range(8)]
-            empty_material = [[0 for _ in range(8)] for _ in range(8)]
-
-            return SquareControl(
-                white_control=empty_control,
-                black_control=empty_control,
-                white_control_material=empty_material,
-                black_control_material=empty_material,
-                white_legal_moves={},
-                black_legal_moves={},
-            )
+            return SquareControl()
 
     def detect_fork(
         self,
@@ -186,7 +173,8 @@ class TacticsService:
                 # Criterion 1: Landing square is undefended
                 safe_landing = True
                 logger.debug(
-                    f"Fork safety check: Landing square {chess.square_name(move.to_square)} is undefended"
+                    "Fork safety check: Landing square %s is undefended",
+                    chess.SQUARE_NAMES[move.to_square],
                 )
             else:
                 # 3. Safety Exception: Check if the landing square is still safe despite being defended
@@ -194,7 +182,9 @@ class TacticsService:
                     # Attacker's control is greater than defender's
                     safe_landing = True
                     logger.debug(
-                        f"Fork safety exception: Attacker control ({attacker_control}) > defender control ({defender_control})"
+                        "Fork safety exception: Attacker control (%s) > defender control (%s)",
+                        attacker_control,
+                        defender_control,
                     )
                 elif (
                     attacker_control == defender_control
@@ -203,7 +193,7 @@ class TacticsService:
                     # Equal control with equal or greater material value
                     safe_landing = True
                     logger.debug(
-                        f"Fork safety exception: Equal control with favorable material exchange"
+                        "Fork safety exception: Equal control with favorable material exchange"
                     )
 
             # If the landing square is not safe by any criteria, no fork
@@ -280,7 +270,9 @@ class TacticsService:
                             # Favorable control ratio
                             favorable_target = True
                             logger.debug(
-                                f"Favorable control ratio: {target_attacker_control} > {target_defender_control}"
+                                "Favorable control ratio: %s > %s",
+                                target_attacker_control,
+                                target_defender_control,
                             )
                         else:
                             # 4. Value Exception: Check if material exchange would favor the attacker
@@ -292,14 +284,19 @@ class TacticsService:
                                 # Target is more valuable than attacker (e.g., knight attacking queen)
                                 favorable_target = True
                                 logger.debug(
-                                    f"Value exception: {chess.square_name(move.to_square)} ({attacker_piece_value}) attacking {chess.square_name(target_square)} ({target_piece_value})"
+                                    "Value exception: %s (%s) attacking %s (%s)",
+                                    chess.SQUARE_NAMES[move.to_square],
+                                    attacker_piece_value,
+                                    chess.SQUARE_NAMES[target_square],
+                                    target_piece_value,
                                 )
 
                         # Special exception for the king: always consider it a valid target
                         if target_piece.piece_type == chess.KING:
                             favorable_target = True
                             logger.debug(
-                                f"King exception: {chess.square_name(target_square)} is always a valid target"
+                                "King exception: %s is always a valid target",
+                                chess.SQUARE_NAMES[target_square],
                             )
 
                         if favorable_target:
@@ -337,11 +334,11 @@ class TacticsService:
                     else piece.symbol().lower()
                 )
 
-                return TacticalMotif(
-                    motif_type="fork",
+                return TacticalMotif.construct(
+                    motif_type=MotifType.FORK,
                     piece=piece_symbol,
-                    piece_square=chess.square_name(move.to_square),
-                    targets=[chess.square_name(sq) for sq in valid_target_squares],
+                    piece_square=move.to_square,
+                    targets=tuple(valid_target_squares),
                     move=move.uci(),
                     description=f"{piece_symbol} fork from {chess.square_name(move.to_square)} targeting {', '.join(target_descriptions)}",
                 )
@@ -382,9 +379,7 @@ class TacticsService:
         try:
             # 1. Check if the move results in a check - if yes, not a pin
             if board_after.is_check():
-                logger.debug(
-                    f"Pin detection: Move {move.uci()} results in check, not a pin"
-                )
+                logger.debug("Pin detection: Move %s results in check, not a pin", move)
                 return None
 
             # 2. Long-Range Piece: Only bishops, rooks, and queens can create pins
@@ -442,14 +437,11 @@ class TacticsService:
                                 first_piece = new_square
 
                                 # Store how many legal moves this piece has before the move
-                                board_copy_before = chess.Board(board_before.fen())
-                                # Get all legal moves for the first piece before the move
-                                legal_moves_before = []
-                                for move_before in board_before.legal_moves:
-                                    if move_before.from_square == new_square:
-                                        legal_moves_before.append(move_before)
-                                piece_legal_moves_before[new_square] = len(
-                                    legal_moves_before
+                                piece_legal_moves_before[new_square] = sum(
+                                    1
+                                    for _ in board_before.generate_legal_moves(
+                                        from_mask=chess.BB_SQUARES[new_square]
+                                    )
                                 )
                             else:
                                 # Same color as pinner, not a pin
@@ -514,7 +506,9 @@ class TacticsService:
                         pinned_pieces.append(first_piece)
                         valuable_pieces_behind.append(second_piece)
                         logger.debug(
-                            f"Pin detected: {chess.square_name(first_piece)} to {chess.square_name(second_piece)}"
+                            "Pin detected: %s to %s",
+                            chess.SQUARE_NAMES[first_piece],
+                            chess.SQUARE_NAMES[second_piece],
                         )
 
             # Create tactical motif for all detected pins
@@ -563,11 +557,11 @@ class TacticsService:
                     else piece.symbol().lower()
                 )
 
-                return TacticalMotif(
-                    motif_type="pin",
+                return TacticalMotif.construct(
+                    motif_type=MotifType.PIN,
                     piece=piece_symbol,
-                    piece_square=chess.square_name(move.to_square),
-                    targets=[chess.square_name(sq) for sq in valid_targets],
+                    piece_square=move.to_square,
+                    targets=tuple(valid_targets),
                     move=move.uci(),
                     description=f"{piece_symbol} creates pin(s) from {chess.square_name(move.to_square)}: {'; '.join(target_descriptions)}",
                 )
@@ -609,7 +603,7 @@ class TacticsService:
             # 1. Check if the move results in a check - if yes, not a skewer
             if board_after.is_check():
                 logger.debug(
-                    f"Skewer detection: Move {move.uci()} results in check, not a skewer"
+                    "Skewer detection: Move %s results in check, not a skewer", move
                 )
                 return None
 
@@ -761,7 +755,9 @@ class TacticsService:
                         skewered_pieces.append(first_piece)
                         pieces_behind.append(second_piece)
                         logger.debug(
-                            f"Skewer detected: {chess.square_name(first_piece)} to {chess.square_name(second_piece)}"
+                            "Skewer detected: %s to %s",
+                            chess.SQUARE_NAMES[first_piece],
+                            chess.SQUARE_NAMES[second_piece],
                         )
 
             # Create tactical motif for all detected skewers
@@ -809,11 +805,11 @@ class TacticsService:
                     else piece.symbol().lower()
                 )
 
-                return TacticalMotif(
-                    motif_type="skewer",
+                return TacticalMotif.construct(
+                    motif_type=MotifType.SKEWER,
                     piece=piece_symbol,
-                    piece_square=chess.square_name(move.to_square),
-                    targets=[chess.square_name(sq) for sq in valid_targets],
+                    piece_square=move.to_square,
+                    targets=tuple(valid_targets),
                     move=move.uci(),
                     description=f"{piece_symbol} creates skewer(s) from {chess.square_name(move.to_square)}: {'; '.join(target_descriptions)}",
                 )
@@ -854,7 +850,7 @@ class TacticsService:
             # 1. Check Status: The move must result in a check
             if not board_after.is_check():
                 logger.debug(
-                    f"Discovered check detection: Move {move.uci()} does not result in check"
+                    "Discovered check detection: Move %s does not result in check", move
                 )
                 return None
 
@@ -903,7 +899,10 @@ class TacticsService:
             # 2. Control Change Detection
             control_change = control_after_val - control_before_val
             logger.debug(
-                f"Control change on king square: {control_change} (before: {control_before_val}, after: {control_after_val})"
+                "Control change on king square: %s (before: %s, after: %s)",
+                control_change,
+                control_before_val,
+                control_after_val,
             )
 
             discovered_check = False
@@ -944,7 +943,6 @@ class TacticsService:
 
                 if checker_piece and checker_square:
                     # Get descriptive info for the tactical motif
-                    king_square_name = chess.square_name(king_square)
                     move_uci = move.uci()
                     from_square_name = chess.square_name(move.from_square)
                     to_square_name = chess.square_name(move.to_square)
@@ -962,11 +960,11 @@ class TacticsService:
                             else checker_piece.symbol().lower()
                         )
 
-                        return TacticalMotif(
-                            motif_type="discovered_check",
+                        return TacticalMotif.construct(
+                            motif_type=MotifType.DISCOVERED_CHECK,
                             piece=piece_symbol,
-                            piece_square=to_square_name,
-                            targets=[king_square_name],
+                            piece_square=move.to_square,
+                            targets=(king_square,),
                             move=move_uci,
                             description=(
                                 f"{piece_symbol} moves from {from_square_name} to "
@@ -993,6 +991,8 @@ class TacticsService:
         board_after: chess.Board,
         move: chess.Move,
         is_best_move: bool = True,
+        control_before: Optional[SquareControl] = None,
+        control_after: Optional[SquareControl] = None,
     ) -> List[TacticalMotif]:
         """
         Analyze a move for tactical patterns and return all detected tactics.
@@ -1005,6 +1005,8 @@ class TacticsService:
             board_after: Board position after move
             move: The move that was played
             is_best_move: Whether this move is Stockfish's recommended best move (default: True)
+            control_before: Square control of board_before, if already calculated
+            control_after: Square control of board_after, if already calculated
 
         Returns:
             List of all detected tactical motifs
@@ -1012,13 +1014,16 @@ class TacticsService:
         # If this isn't the best move, we don't analyze it for tactics
         # This follows our updated specification that focuses exclusively on optimal moves
         if not is_best_move:
-            logger.debug(f"Skipping tactical analysis for non-best move: {move.uci()}")
+            logger.debug("Skipping tactical analysis for non-best move: %s", move)
             return []
 
         try:
-            # Calculate square control metrics before and after the move
-            control_before = self.calculate_square_control(board_before)
-            control_after = self.calculate_square_control(board_after)
+            # Calculate square control metrics before and after the move,
+            # unless the caller already has them
+            if control_before is None:
+                control_before = self.calculate_square_control(board_before)
+            if control_after is None:
+                control_after = self.calculate_square_control(board_after)
 
             # Check for each tactical pattern - accumulate all tactics found
             tactics = []
@@ -1034,7 +1039,7 @@ class TacticsService:
                     )
                     if tactic:
                         logger.info(
-                            f"{tactic_type.capitalize()} detected in move {move.uci()}"
+                            "%s detected in move %s", tactic_type.capitalize(), move
                         )
                         return tactic
                     return None
@@ -1068,10 +1073,10 @@ class TacticsService:
                 tactics.append(discovered_check)
 
             # Log summary of all tactics found
-            if tactics:
-                tactic_types = [t.motif_type for t in tactics]
+            if tactics and logger.isEnabledFor(logging.INFO):
+                tactic_types = [t.motif_type.label for t in tactics]
                 logger.info(
-                    f"Move {move.uci()} has {len(tactics)} tactics: {tactic_types}"
+                    "Move %s has %d tactics: %s", move, len(tactics), tactic_types
                 )
 
             return tactics
@@ -0,0 +1,108 @@
+from typing import Dict, Optional
+
+import chess
+import numpy as np
+
+# Slot flags
+_OCCUPIED = 1
+_IS_MATE = 2
+
+
+def _encode_move(uci: Optional[str]) -> int:
+    """Pack a UCI move into 15 bits: from square, to square and promotion piece."""
+    if not uci:
+        return 0
+    move = chess.Move.from_uci(uci)
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def _decode_move(code: int) -> Optional[str]:
+    """Unpack a move produced by _encode_move back into UCI notation."""
+    if code == 0:
+        return None
+    move = chess.Move(code & 63, (code >> 6) & 63, (code >> 12) or None)
+    return move.uci()
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of engine evaluations keyed by Zobrist hash.
+
+    Entries are stored as a struct of parallel NumPy arrays with open
+    addressing (slot = key & (size - 1)), so the table takes a fixed
+    ~16 bytes per slot instead of a dict entry plus an evaluation dict.
+    A colliding position always replaces the slot, while a repeated store of
+    the same position keeps the deeper of the two results.
+    """
+
+    def __init__(self, min_size: int):
+        """
+        Allocate the table.
+
+        Args:
+            min_size: Minimum number of slots; rounded up to a power of two
+        """
+        self.size = 1 << max(0, int(min_size) - 1).bit_length()
+        self._mask = self.size - 1
+
+        self.keys = np.zeros(self.size, dtype=np.uint64)
+        self.values = np.zeros(self.size, dtype=np.float32)
+        self.depths = np.zeros(self.size, dtype=np.uint8)
+        self.flags = np.zeros(self.size, dtype=np.uint8)
+        self.mate_in = np.zeros(self.size, dtype=np.int16)
+        self.best_moves = np.zeros(self.size, dtype=np.uint16)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.flags & _OCCUPIED))
+
+    def probe(self, key: int, min_depth: int) -> Optional[Dict]:
+        """
+        Look up the evaluation of a position.
+
+        Args:
+            key: Zobrist hash of the position
+            min_depth: Minimum search depth the stored result must have
+
+        Returns:
+            Evaluation dict (without "fen"), or None on a miss or a shallower entry
+        """
+        i = key & self._mask
+        flags = int(self.flags[i])
+        if not flags & _OCCUPIED or int(self.keys[i]) != key:
+            return None
+        depth = int(self.depths[i])
+        if depth < min_depth:
+            return None
+
+        is_mate = bool(flags & _IS_MATE)
+        return {
+            # Evaluations are whole centipawns, so rounding undoes float32 error
+            "evaluation": round(float(self.values[i]), 2),
+            "depth": depth,
+            "is_mate": is_mate,
+            "mate_in": int(self.mate_in[i]) if is_mate else None,
+            "best_move": _decode_move(int(self.best_moves[i])),
+        }
+
+    def store(self, key: int, result: Dict) -> None:
+        """
+        Store the evaluation of a position.
+
+        Args:
+            key: Zobrist hash of the position
+            result: Evaluation dict as returned by StockfishService.evaluate_position
+        """
+        i = key & self._mask
+        if (
+            self.flags[i] & _OCCUPIED
+            and int(self.keys[i]) == key
+            and self.depths[i] > result["depth"]
+        ):
+            return
+
+        self.keys[i] = key
+        self.values[i] = result["evaluation"]
+        self.depths[i] = result["depth"]
+        self.flags[i] = _OCCUPIED | (_IS_MATE if result["is_mate"] else 0)
+        self.mate_in[i] = result["mate_in"] or 0
+        self.best_moves[i] = _encode_move(result["best_move"])
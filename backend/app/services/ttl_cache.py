@@ -0,0 +1,66 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """
+    Small in-process cache whose entries expire a fixed time after being stored.
+
+    Entries are only used from the event loop, so no locking is needed. Once
+    the cache is full, storing a new entry evicts the oldest one.
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Seconds an entry stays valid after it was stored
+            max_size: Maximum number of entries kept
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Get the value stored for a key, unless it expired.
+
+        Args:
+            key: Key of the entry
+
+        Returns:
+            Optional[Any]: The stored value, or None if missing or expired
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store a value for a key, replacing any previous entry.
+
+        Args:
+            key: Key of the entry
+            value: Value to store
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Remove the entries whose key matches a predicate.
+
+        Args:
+            predicate: Function returning True for the keys to remove
+        """
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
@@ -167,8 +167,10 @@ export const gameApi = {
   },
 
   // Make a move
-  makeMove: async (fen: string, move: string) => {
-    const response = await api.post('/games/move', { fen, move });
+  makeMove: async (fen: string, move: string, includeLegalMoves: boolean = true) => {
+    const response = await api.post('/games/move', { fen, move }, {
+      params: { include_legal_moves: includeLegalMoves }
+    });
     return response.data;
   },
 
@@ -0,0 +1,29 @@
+-- Persist engine evaluations keyed by the Zobrist hash of the position so that
+-- positions shared across games (openings in particular) are only analysed once
+BEGIN;
+
+-- Zobrist hashes are unsigned 64-bit values; they are stored reinterpreted as signed BIGINT
+CREATE TABLE IF NOT EXISTS position_eval_cache (
+  zobrist BIGINT NOT NULL,
+  depth INTEGER NOT NULL,
+  evaluation FLOAT NOT NULL, -- Evaluation in pawns from the side to move's perspective
+  best_move VARCHAR(5),
+  is_mate BOOLEAN NOT NULL DEFAULT FALSE,
+  mate_in INTEGER,
+  created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (zobrist, depth)
+);
+
+COMMENT ON TABLE position_eval_cache IS 'Transposition table of Stockfish evaluations shared across all games';
+COMMENT ON COLUMN position_eval_cache.zobrist IS 'Polyglot Zobrist hash of the position, stored as a signed 64-bit integer';
+
+-- Only the backend (service role) reads and writes the cache
+ALTER TABLE position_eval_cache ENABLE ROW LEVEL SECURITY;
+
+-- Record the position reached by each annotated move for position-level deduplication
+ALTER TABLE move_annotations
+  ADD COLUMN IF NOT EXISTS position_hash BIGINT;
+
+CREATE INDEX IF NOT EXISTS move_annotations_position_hash_idx ON move_annotations(position_hash);
+
+COMMIT;
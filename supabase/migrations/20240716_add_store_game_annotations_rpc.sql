@@ -0,0 +1,36 @@
+-- Store all move annotations of a game and mark it as analyzed in a single
+-- round trip and a single transaction, so a game can never end up marked as
+-- analyzed with missing or partial annotations. The inserted row count is
+-- returned as a row, since the PostgREST client expects a list of rows
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.store_game_annotations(p_game_id UUID, p_annotations JSONB)
+RETURNS TABLE (inserted_count INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    _inserted INTEGER;
+BEGIN
+    -- Drop leftovers of an earlier failed or interrupted annotation run
+    DELETE FROM public.move_annotations WHERE game_id = p_game_id;
+
+    INSERT INTO public.move_annotations (
+        game_id, move_number, move_san, move_uci, color, fen_before, fen_after,
+        position_hash, evaluation_before, evaluation_after, evaluation_change,
+        classification, is_best_move, is_book_move
+    )
+    SELECT
+        p_game_id, a.move_number, a.move_san, a.move_uci, a.color, a.fen_before, a.fen_after,
+        a.position_hash, a.evaluation_before, a.evaluation_after, a.evaluation_change,
+        a.classification, a.is_best_move, a.is_book_move
+    FROM jsonb_populate_recordset(NULL::public.move_annotations, p_annotations) AS a;
+
+    GET DIAGNOSTICS _inserted = ROW_COUNT;
+
+    UPDATE public.games SET analyzed = TRUE WHERE id = p_game_id;
+
+    RETURN QUERY SELECT _inserted;
+END;
+$$;
+
+COMMIT;
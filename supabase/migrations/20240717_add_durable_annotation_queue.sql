@@ -0,0 +1,31 @@
+-- Keep the game annotation queue in the database instead of process memory,
+-- so queued games survive restarts and are shared by every API replica.
+-- A game is queued while annotation_queued_at is set; workers claim games
+-- with claim_queued_game, which skips rows locked by other workers
+BEGIN;
+
+ALTER TABLE public.games
+    ADD COLUMN IF NOT EXISTS annotation_queued_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS annotation_started_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_games_annotation_queued_at
+    ON public.games (annotation_queued_at)
+    WHERE annotation_queued_at IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION public.claim_queued_game()
+RETURNS SETOF public.games
+LANGUAGE sql
+AS $$
+    UPDATE public.games
+    SET annotation_queued_at = NULL, annotation_started_at = NOW()
+    WHERE id = (
+        SELECT id FROM public.games
+        WHERE annotation_queued_at IS NOT NULL AND processing
+        ORDER BY annotation_queued_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *;
+$$;
+
+COMMIT;
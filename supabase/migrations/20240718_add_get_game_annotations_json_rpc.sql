@@ -0,0 +1,39 @@
+-- Build the annotation response of an already annotated game in the database,
+-- so the API returns the stored annotations as one JSON document instead of
+-- assembling the response row by row. The document is returned as a single
+-- row, since the PostgREST client expects a list of rows
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.get_game_annotations_json(p_game_id UUID)
+RETURNS TABLE (game_id UUID, total_moves INTEGER, annotations JSON)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        p_game_id,
+        COUNT(*)::INTEGER,
+        COALESCE(
+            json_agg(
+                json_build_object(
+                    'move_number', ma.move_number,
+                    'move_san', ma.move_san,
+                    'move_uci', ma.move_uci,
+                    'color', ma.color,
+                    'fen_before', ma.fen_before,
+                    'fen_after', ma.fen_after,
+                    'evaluation_before', ma.evaluation_before,
+                    'evaluation_after', ma.evaluation_after,
+                    'evaluation_change', ma.evaluation_change,
+                    'classification', ma.classification,
+                    'is_best_move', ma.is_best_move,
+                    'is_book_move', ma.is_book_move
+                )
+                ORDER BY ma.move_number
+            ),
+            '[]'::JSON
+        )
+    FROM public.move_annotations ma
+    WHERE ma.game_id = p_game_id;
+$$;
+
+COMMIT;
@@ -0,0 +1,21 @@
+-- Claim and queue a batch of unprocessed games in a single statement.
+-- FOR UPDATE SKIP LOCKED makes concurrent batch requests claim disjoint sets
+-- of games without the select-then-update round trips
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.claim_unprocessed_games(batch_limit INTEGER)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+    UPDATE public.games AS g
+    SET processing = TRUE, annotation_queued_at = NOW()
+    WHERE g.id IN (
+        SELECT u.id FROM public.games AS u
+        WHERE NOT u.enhanced_analyzed AND NOT u.processing
+        LIMIT batch_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING g.id;
+$$;
+
+COMMIT;
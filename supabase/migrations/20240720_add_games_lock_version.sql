@@ -0,0 +1,26 @@
+-- Version games for optimistic locking: every claim for processing bumps
+-- lock_version, so a claim made from a stale read of a game fails instead of
+-- racing another claimer
+BEGIN;
+
+ALTER TABLE public.games
+    ADD COLUMN IF NOT EXISTS lock_version INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION public.claim_unprocessed_games(batch_limit INTEGER)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+    UPDATE public.games AS g
+    SET processing = TRUE,
+        annotation_queued_at = NOW(),
+        lock_version = g.lock_version + 1
+    WHERE g.id IN (
+        SELECT u.id FROM public.games AS u
+        WHERE NOT u.enhanced_analyzed AND NOT u.processing
+        LIMIT batch_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING g.id;
+$$;
+
+COMMIT;
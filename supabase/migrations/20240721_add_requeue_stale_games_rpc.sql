@@ -0,0 +1,17 @@
+-- Queue again, in one statement, claimed games whose worker never finished
+-- them. Only the ids of the queued games are returned instead of whole rows
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.requeue_stale_games(stale_minutes INTEGER)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+    UPDATE public.games AS g
+    SET annotation_queued_at = NOW()
+    WHERE g.processing
+      AND g.annotation_queued_at IS NULL
+      AND g.annotation_started_at < NOW() - make_interval(mins => stale_minutes)
+    RETURNING g.id;
+$$;
+
+COMMIT;
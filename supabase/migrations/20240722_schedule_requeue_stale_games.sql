@@ -0,0 +1,11 @@
+-- Sweep stale claimed games from the database every five minutes with
+-- pg_cron instead of an hourly loop in each API process. A claimed game is
+-- stale once its worker has not finished it for an hour
+CREATE EXTENSION IF NOT EXISTS pg_cron;
+
+-- Scheduling a job under an existing name replaces it
+SELECT cron.schedule(
+    'requeue-stale-games',
+    '*/5 * * * *',
+    $$SELECT public.requeue_stale_games(60)$$
+);
@@ -0,0 +1,73 @@
+-- Store the enhanced annotations of a game, their tactical motifs and the
+-- player weakness report, and mark the game as enhanced analyzed, in a single
+-- round trip and a single transaction. Each annotation carries its motifs in a
+-- nested "tactical_motifs" array. The inserted annotation count is returned as
+-- a row, since the PostgREST client expects a list of rows
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.store_enhanced_annotations(
+    p_game_id UUID,
+    p_user_id UUID,
+    p_annotations JSONB,
+    p_weakness_report JSONB
+)
+RETURNS TABLE (inserted_count INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    _annotations JSONB;
+    _inserted INTEGER;
+BEGIN
+    -- Drop the results of an earlier analysis run; motifs cascade
+    DELETE FROM public.enhanced_move_annotations WHERE game_id = p_game_id;
+    DELETE FROM public.player_weakness_reports WHERE game_id = p_game_id;
+
+    -- Assign the annotation ids up front so the motifs can reference them
+    SELECT COALESCE(jsonb_agg(a.value || jsonb_build_object('id', uuid_generate_v4())), '[]'::JSONB)
+    INTO _annotations
+    FROM jsonb_array_elements(p_annotations) AS a;
+
+    INSERT INTO public.enhanced_move_annotations (
+        id, game_id, move_san, move_uci, move_number, color, fen_before, fen_after,
+        evaluation_before, evaluation_after, evaluation_change, classification,
+        is_best_move, is_book_move, best_move, square_control_before,
+        square_control_after, move_improvement
+    )
+    SELECT
+        a.id, p_game_id, a.move_san, a.move_uci, a.move_number, a.color, a.fen_before, a.fen_after,
+        a.evaluation_before, a.evaluation_after, a.evaluation_change, a.classification,
+        a.is_best_move, a.is_book_move, a.best_move, a.square_control_before,
+        a.square_control_after, a.move_improvement
+    FROM jsonb_populate_recordset(NULL::public.enhanced_move_annotations, _annotations) AS a;
+
+    GET DIAGNOSTICS _inserted = ROW_COUNT;
+
+    INSERT INTO public.tactical_motifs (
+        annotation_id, motif_type, piece, piece_square, targets, move, description
+    )
+    SELECT
+        (a.value ->> 'id')::UUID, m.motif_type, m.piece, m.piece_square, m.targets, m.move, m.description
+    FROM jsonb_array_elements(_annotations) AS a,
+        jsonb_populate_recordset(
+            NULL::public.tactical_motifs,
+            COALESCE(a.value -> 'tactical_motifs', '[]'::JSONB)
+        ) AS m;
+
+    INSERT INTO public.player_weakness_reports (
+        user_id, game_id, tactical_weakness, positional_weakness, opening_weakness,
+        endgame_weakness, critical_positions
+    )
+    SELECT
+        p_user_id, p_game_id, w.tactical_weakness, w.positional_weakness, w.opening_weakness,
+        w.endgame_weakness, w.critical_positions
+    FROM jsonb_populate_record(NULL::public.player_weakness_reports, p_weakness_report) AS w;
+
+    UPDATE public.games
+    SET enhanced_analyzed = TRUE, processing = FALSE
+    WHERE id = p_game_id;
+
+    RETURN QUERY SELECT _inserted;
+END;
+$$;
+
+COMMIT;
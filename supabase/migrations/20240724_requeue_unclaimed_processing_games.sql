@@ -0,0 +1,23 @@
+-- Also queue again games flagged as processing that were never claimed from
+-- the durable queue, such as games left in the old in-memory queue. They have
+-- neither annotation_queued_at nor annotation_started_at, so
+-- claim_unprocessed_games (which skips processing games) and the stale check
+-- on annotation_started_at would otherwise never pick them up
+BEGIN;
+
+CREATE OR REPLACE FUNCTION public.requeue_stale_games(stale_minutes INTEGER)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+    UPDATE public.games AS g
+    SET annotation_queued_at = NOW()
+    WHERE g.processing
+      AND g.annotation_queued_at IS NULL
+      AND (
+          g.annotation_started_at IS NULL
+          OR g.annotation_started_at < NOW() - make_interval(mins => stale_minutes)
+      )
+    RETURNING g.id;
+$$;
+
+COMMIT;